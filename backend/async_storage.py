@@ -0,0 +1,141 @@
+"""Asyncio front end for storage.py, with the same function names.
+
+Endpoints `await` these instead of calling storage directly. Reads that the
+in-process table caches can answer return straight away on the event loop.
+Everything that needs the database runs on a dedicated executor sized to the
+connection pool (DB_POOL_MAX), so a slow Neon round trip ties up a DB worker,
+not one of Starlette's request threads, and no more threads block than there
+are connections to serve them.
+
+The synchronous API in storage.py stays the one to use from the cron job,
+scripts and other threads; both share the same pool, caches and writer.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+from storage import DEFAULT_USER
+
+_executor = ThreadPoolExecutor(max_workers=storage.DB_POOL_MAX, thread_name_prefix="db")
+_lock = threading.Lock()
+_stats = {"calls": 0, "in_flight": 0, "cache_fast_path": 0}
+
+
+async def _run(fn, *args, **kwargs):
+    """Run a blocking storage call on the DB executor."""
+    with _lock:
+        _stats["calls"] += 1
+        _stats["in_flight"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+    finally:
+        with _lock:
+            _stats["in_flight"] -= 1
+
+
+def _cached_versioned(table, user_id):
+    cached = storage.peek_versioned(table, user_id)
+    if cached is not None:
+        with _lock:
+            _stats["cache_fast_path"] += 1
+    return cached
+
+
+def peek_versioned(table, user_id=DEFAULT_USER):
+    """(dict, version) of a cached table, or None — no I/O, so no await."""
+    return _cached_versioned(table, user_id)
+
+
+def _cached(table, user_id):
+    cached = _cached_versioned(table, user_id)
+    return cached[0] if cached is not None else None
+
+
+def executor_stats():
+    """DB executor size and call counters."""
+    with _lock:
+        return {"max_workers": storage.DB_POOL_MAX, **_stats}
+
+
+async def load_progress(user_id=DEFAULT_USER):
+    return await _run(storage.load_progress, user_id)
+
+async def save_progress(data, user_id=DEFAULT_USER):
+    return await _run(storage.save_progress, data, user_id)
+
+async def set_progress(key, completed, user_id=DEFAULT_USER):
+    return await _run(storage.set_progress, key, completed, user_id)
+
+async def apply_batch(writes, user_id=DEFAULT_USER):
+    return await _run(storage.apply_batch, writes, user_id)
+
+
+async def load_study_time(user_id=DEFAULT_USER):
+    data = _cached("study_time", user_id)
+    return data if data is not None else await _run(storage.load_study_time, user_id)
+
+async def load_study_time_range(from_date=None, to_date=None, user_id=DEFAULT_USER):
+    return await _run(storage.load_study_time_range, from_date, to_date, user_id)
+
+async def set_study_time(key, seconds, user_id=DEFAULT_USER):
+    return await _run(storage.set_study_time, key, seconds, user_id)
+
+
+async def load_task_pages(user_id=DEFAULT_USER):
+    data = _cached("task_pages", user_id)
+    return data if data is not None else await _run(storage.load_task_pages, user_id)
+
+async def load_task_pages_range(from_date=None, to_date=None, user_id=DEFAULT_USER):
+    return await _run(storage.load_task_pages_range, from_date, to_date, user_id)
+
+async def set_task_page(key, page, exact=False, user_id=DEFAULT_USER):
+    return await _run(storage.set_task_page, key, page, exact, user_id)
+
+
+async def load_revisions(user_id=DEFAULT_USER):
+    data = _cached("revisions", user_id)
+    return data if data is not None else await _run(storage.load_revisions, user_id)
+
+async def set_revision(key, done, user_id=DEFAULT_USER):
+    return await _run(storage.set_revision, key, done, user_id)
+
+
+async def load_reviews(user_id=DEFAULT_USER):
+    data = _cached("reviews", user_id)
+    return data if data is not None else await _run(storage.load_reviews, user_id)
+
+async def load_reviews_due(on, limit=None, user_id=DEFAULT_USER):
+    return await _run(storage.load_reviews_due, on, limit, user_id)
+
+async def set_review(key, state, user_id=DEFAULT_USER):
+    return await _run(storage.set_review, key, state, user_id)
+
+
+async def load_confidence(user_id=DEFAULT_USER):
+    data = _cached("confidence", user_id)
+    return data if data is not None else await _run(storage.load_confidence, user_id)
+
+async def set_confidence(key, level, user_id=DEFAULT_USER):
+    return await _run(storage.set_confidence, key, level, user_id)
+
+
+async def load_versioned(table, user_id=DEFAULT_USER):
+    cached = _cached_versioned(table, user_id)
+    return cached if cached is not None else await _run(storage.load_versioned, table, user_id)
+
+
+async def load_changes(since, user_id=DEFAULT_USER):
+    return await _run(storage.load_changes, since, user_id)
+
+
+async def get_preference(key, default=None, user_id=DEFAULT_USER):
+    data = _cached("preferences", user_id)
+    if data is not None:
+        return data.get(key, default)
+    return await _run(storage.get_preference, key, default, user_id)
+
+async def set_preference(key, value, user_id=DEFAULT_USER):
+    return await _run(storage.set_preference, key, value, user_id)
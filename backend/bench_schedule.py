@@ -0,0 +1,67 @@
+"""Time the tracker and numpy schedule engines on synthetic syllabi.
+
+    python bench_schedule.py [chapters per subject ...]
+
+Each run builds a seeded random syllabus with that many chapters for every
+pipeline subject, checks both engines produce the same plan, and prints the
+best of a few timings for each.
+"""
+import datetime
+import gc
+import random
+import sys
+import time
+
+import scheduler
+import scheduler_numpy
+
+
+def synthetic_syllabus(chapters, seed=0):
+    rng = random.Random(seed)
+    syllabus = {}
+    for pipeline in scheduler.PIPELINES:
+        for name in pipeline:
+            page = 1
+            rows = []
+            for i in range(chapters):
+                length = rng.randint(4, 40)
+                rows.append({
+                    "chapter": f"{i + 1}. Chapter {i + 1}",
+                    "start": page,
+                    "end": page + length - 1,
+                    "hardness": round(rng.uniform(1.0, 5.0), 1),
+                })
+                page += length + rng.choice((0, 0, 0, 2))
+            syllabus[name] = rows
+    return syllabus
+
+
+def best_of(runs, fn):
+    best = result = None
+    for _ in range(runs):
+        # Drop the previous plan first, so neither engine's timing includes
+        # the collector walking the other's output
+        result = None
+        gc.collect()
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(sizes):
+    start = datetime.date(2026, 7, 20)
+    for chapters in sizes:
+        syllabus = synthetic_syllabus(chapters)
+        runs = 5 if chapters <= 1000 else 3
+        t_py, plan_py = best_of(runs, lambda: scheduler._run_schedule(start, {}, syllabus=syllabus).days)
+        t_np, plan_np = best_of(runs, lambda: scheduler_numpy.generate(start, {}, syllabus))
+        status = "same plan" if plan_py == plan_np else "PLANS DIFFER"
+        print(f"{chapters:>6} chapters/subject, {len(plan_py):>6} days: "
+              f"python {t_py * 1000:8.1f} ms, numpy {t_np * 1000:8.1f} ms, "
+              f"{t_py / t_np:4.1f}x ({status})")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000])
@@ -0,0 +1,244 @@
+"""Monte Carlo finish-date forecasts from the user's observed reading pace.
+
+Pace is sampled as the ratio of actual to planned minutes over completed,
+well-studied blocks (the same blocks the frontend's personalPace learns
+from). Each trial draws a ratio for every unread block of a subject, so the
+subject's remaining work is sum(planned minutes x ratio); that work is then
+laid against the minutes the plan gives the subject from today on (and, past
+the plan's end, its average daily share) to find the day it would be done.
+
+Trials run in chunks on a process pool and the call is time-boxed: whatever
+chunks finish inside the budget make up the answer, and the response says
+how many trials that was (possibly none). Workers only run _simulate(),
+which is pure Python over plain lists. They come from a forkserver, not a
+fork of the server, whose other threads may hold locks at fork time. Workers
+must never import the app (main.py): that would re-run its startup — database
+init, progress load, a second daily notification job — in each of them. The
+forkserver preloads only this module.
+"""
+import bisect
+import concurrent.futures
+import datetime
+import math
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from plan_view import page_ranges
+
+FORECAST_TRIALS = int(os.environ.get("FORECAST_TRIALS", "2000"))
+FORECAST_WORKERS = int(os.environ.get("FORECAST_WORKERS", str(min(4, os.cpu_count() or 1))))
+FORECAST_TIME_BUDGET_MS = int(os.environ.get("FORECAST_TIME_BUDGET_MS", "1500"))
+
+# A completed block counts toward pace only with a real stretch of focus on it,
+# and a subject needs this many such blocks (same rules as insights.personalPace)
+MIN_STUDIED_SEC = 600
+MIN_SAMPLES = 3
+
+PERCENTILES = (10, 50, 90)
+
+_CHUNK_TRIALS = 250
+_NOT_STUDY = ("Revision", "Buffer")
+
+
+def build_inputs(schedule, completion_status, study_time, today):
+    """Per-subject simulation inputs from a plan, its ProgressMap and the
+    user's study_time map ("date_slot" -> seconds), as of `today`."""
+    today_iso = today.isoformat()
+    future = [day["date"] for day in schedule if day["date"] >= today_iso]
+    future_index = {date: i for i, date in enumerate(future)}
+
+    subjects = {}
+    for day in schedule:
+        date = day["date"]
+        done = completion_status.day(date)
+        for slot in day["slots"]:
+            subject = slot["subject"]
+            if subject in _NOT_STUDY:
+                continue
+            minutes = slot.get("minutes", 0)
+            s = subjects.get(subject)
+            if s is None:
+                s = subjects[subject] = {
+                    "remaining": [], "capacity": [0] * len(future), "ratios": [],
+                    "planned": 0, "first": date, "last": date,
+                }
+            s["last"] = date
+            s["planned"] += minutes
+            i = future_index.get(date)
+            if i is not None:
+                s["capacity"][i] += minutes
+            if not done.get(slot["name"], False):
+                s["remaining"].append(minutes)
+                continue
+            seconds = study_time.get(f"{date}_{slot['name']}", 0)
+            pages = sum(b - a + 1 for a, b in page_ranges(slot))
+            if seconds >= MIN_STUDIED_SEC and pages > 0 and minutes > 0:
+                s["ratios"].append(seconds / 60 / minutes)
+
+    pooled = [r for s in subjects.values() for r in s["ratios"]]
+    inputs = {}
+    for subject, s in subjects.items():
+        if len(s["ratios"]) >= MIN_SAMPLES:
+            ratios, source = s["ratios"], "own"
+        elif len(pooled) >= MIN_SAMPLES:
+            ratios, source = pooled, "pooled"
+        else:
+            ratios, source = [1.0], "plan"
+        span = (datetime.date.fromisoformat(s["last"]) - datetime.date.fromisoformat(s["first"])).days + 1
+        inputs[subject] = {
+            "remaining": s["remaining"],
+            "cumulative": list(_running_sum(s["capacity"])),
+            # Minutes per calendar day the plan gives the subject, for work
+            # that runs past the plan's end
+            "tail_rate": s["planned"] / span,
+            "ratios": ratios,
+            "source": source,
+            "samples": len(s["ratios"]),
+            "plan_end": s["last"],
+        }
+    return inputs
+
+
+def _running_sum(values):
+    total = 0
+    for v in values:
+        total += v
+        yield total
+
+
+def _finish_offset(work, cumulative, tail_rate):
+    """Days after today on which `work` minutes are covered."""
+    i = bisect.bisect_left(cumulative, work)
+    if i < len(cumulative):
+        return i
+    covered = cumulative[-1] if cumulative else 0
+    if tail_rate <= 0:
+        return None
+    return max(0, len(cumulative) - 1 + math.ceil((work - covered) / tail_rate))
+
+
+def _simulate(inputs, trials, seed):
+    """Finish-day offsets for `trials` trials, per subject with work left."""
+    rng = random.Random(seed)
+    out = {}
+    for subject, s in inputs.items():
+        remaining = s["remaining"]
+        if not remaining:
+            continue
+        ratios, cumulative, tail_rate = s["ratios"], s["cumulative"], s["tail_rate"]
+        offsets = out[subject] = []
+        for _ in range(trials):
+            work = sum(m * r for m, r in zip(remaining, rng.choices(ratios, k=len(remaining))))
+            offsets.append(_finish_offset(work, cumulative, tail_rate))
+    return out
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    """The shared worker pool, started on first use; None if processes
+    can't be started here (then trials run in the calling thread)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None and FORECAST_WORKERS > 1:
+            try:
+                ctx = multiprocessing.get_context("forkserver")
+                # The forkserver preloads __main__ by default, which under
+                # `python main.py` would re-run the app's startup in every worker
+                ctx.set_forkserver_preload(["forecast"])
+                _pool = concurrent.futures.ProcessPoolExecutor(max_workers=FORECAST_WORKERS, mp_context=ctx)
+            except (OSError, ValueError) as e:
+                print(f"Forecast pool unavailable, running inline: {e}")
+                _pool = False
+        return _pool or None
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _run_chunks(inputs, trials, budget_s, seed):
+    """Merged chunk results finished inside the budget."""
+    sizes = [min(_CHUNK_TRIALS, trials - start) for start in range(0, trials, _CHUNK_TRIALS)]
+    results = None
+    pool = _executor()
+    if pool is not None:
+        try:
+            futures = [pool.submit(_simulate, inputs, n, seed + i) for i, n in enumerate(sizes)]
+            done, pending = concurrent.futures.wait(futures, timeout=budget_s)
+            # Chunks already running can't be cancelled; they finish in the
+            # background and are dropped
+            for future in pending:
+                future.cancel()
+            results = [future.result() for future in done]
+        except BrokenProcessPool as e:
+            print(f"Forecast pool failed, running inline: {e}")
+            shutdown()
+            results = None
+    if results is None:
+        results = []
+        deadline = time.monotonic() + budget_s
+        for i, n in enumerate(sizes):
+            results.append(_simulate(inputs, n, seed + i))
+            if time.monotonic() >= deadline:
+                break
+
+    merged = {}
+    for result in results:
+        for subject, offsets in result.items():
+            merged.setdefault(subject, []).extend(offsets)
+    return merged
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run(inputs, today, trials=FORECAST_TRIALS, budget_ms=FORECAST_TIME_BUDGET_MS, seed=0):
+    """The /api/forecast body for build_inputs() output."""
+    t0 = time.perf_counter()
+    offsets = _run_chunks(inputs, trials, budget_ms / 1000, seed)
+
+    subjects = {}
+    completed_trials = 0
+    for subject, s in inputs.items():
+        entry = {
+            "plan_end": s["plan_end"],
+            "remaining_blocks": len(s["remaining"]),
+            "pace_source": s["source"],
+            "pace_samples": s["samples"],
+        }
+        runs = offsets.get(subject)
+        if not s["remaining"]:
+            entry["finished"] = True
+        else:
+            runs = runs or []
+            completed_trials = max(completed_trials, len(runs))
+            finite = sorted(o for o in runs if o is not None)
+            for pct in PERCENTILES:
+                entry[f"p{pct}"] = (
+                    (today + datetime.timedelta(days=_percentile(finite, pct))).isoformat()
+                    if finite else None
+                )
+        subjects[subject] = entry
+
+    return {
+        "today": today.isoformat(),
+        "trials": completed_trials,
+        "trials_requested": trials,
+        "complete": completed_trials >= trials or all(not s["remaining"] for s in inputs.values()),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+        "subjects": subjects,
+    }
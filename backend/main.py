@@ -1,27 +1,48 @@
-import copy
+import time
+
+_PROCESS_T0 = time.perf_counter()
+
 import os
+import sys
+
+if __name__ == "__main__":
+    # `python main.py` serves the app as the documented `uvicorn main:app`
+    # does. Serving it with this script as __main__ would make every forecast
+    # worker re-run the script's startup (database init, a second daily
+    # notification job), since multiprocessing re-imports the parent's
+    # __main__ in each child.
+    os.execv(sys.executable, [
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000",
+        "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+    ])
+
 import re
+import secrets
 import json
 import atexit
 import datetime
+import itertools
+import threading
 import zoneinfo
+from contextlib import contextmanager
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from typing import List, Optional
 
-from scheduler import generate_schedule
+from scheduler import generate_schedule, load_or_generate_schedule, schedule_memo_stats
 from storage import (
-    load_progress, save_progress, init_db, get_preference, set_preference,
-    load_study_time, set_study_time,
-    load_task_pages, set_task_page,
-    load_revisions, set_revision,
-    load_reviews, set_review,
-    load_confidence, set_confidence,
+    DEFAULT_USER, USER_CACHE_SIZE, LRUCache,
+    load_progress, save_progress, load_study_time, load_task_pages, init_db, get_preference, set_preference, load_preference_users,
+    pool_stats, group_commit_stats, cache_stats, close_pool,
 )
 from notifier import send_daily_notification
+from plan_view import BacklogIndex, ChapterIndex, PlanAnalytics, PlanListeners, PlanStats, SerializedPlan, page_ranges
+import async_storage as db
+import forecast
 
 app = FastAPI()
 
@@ -37,6 +58,26 @@ class ReviewInput(BaseModel):
 
 CONFIDENCE_LEVELS = {"weak", "medium", "strong"}
 
+class BatchOp(BaseModel):
+    """One write in a /api/batch request. `op` picks the kind; each kind reads
+    the same fields as its single-write endpoint."""
+    op: str  # mark | study_time | task_page | revision | review | confidence
+    key: Optional[str] = None
+    date: Optional[str] = None
+    slot_name: Optional[str] = None
+    completed: Optional[bool] = None
+    seconds: Optional[int] = None
+    page: Optional[int] = None
+    exact: bool = False
+    done: Optional[bool] = None
+    state: Optional[dict] = None
+    level: Optional[str] = None
+
+class BatchInput(BaseModel):
+    ops: List[BatchOp]
+
+MAX_BATCH_OPS = 500
+
 _ALLOWED_ORIGINS = [o.strip() for o in os.environ.get("ALLOWED_ORIGINS", "").split(",") if o.strip()]
 if not _ALLOWED_ORIGINS:
     _ALLOWED_ORIGINS = ["*"]
@@ -47,183 +88,619 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+# Startup phases and their durations (ms), printed once and kept for /api/metrics
+startup_report = {"phases": {}}
+
+@contextmanager
+def _startup_phase(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_report["phases"][name] = round((time.perf_counter() - t0) * 1000, 1)
+
+startup_report["phases"]["imports"] = round((time.perf_counter() - _PROCESS_T0) * 1000, 1)
+
 # Initialize database
-init_db()
+with _startup_phase("init_db"):
+    init_db()
+
+# Plan generations, unique process-wide so a state rebuilt after eviction
+# never reuses an ETag
+_generations = itertools.count(1)
+
+class UserState:
+    """One user's generated plan and completion map, as held in user_states.
+    `generation` changes whenever the plan is replaced; `plan` is the plan's
+    pre-encoded /api/plan body, `stats` its /api/stats counters,
+    `analytics` its /api/analytics aggregates, `chapters` its
+    chapter-completion index and `backlog` the daily notification's
+    backlog index."""
+    __slots__ = ("user_id", "schedule", "plan", "stats", "analytics", "chapters", "backlog",
+                 "generation", "completion_status")
+
+    def __init__(self, user_id, schedule, completion_status):
+        self.user_id = user_id
+        self.completion_status = completion_status
+        self.set_schedule(schedule)
+
+    def set_schedule(self, schedule):
+        self.schedule = schedule
+        self.plan = SerializedPlan(schedule)
+        study_time = load_study_time(self.user_id)
+        task_pages = load_task_pages(self.user_id)
+        self.stats, self.analytics, self.chapters, self.backlog = self.completion_status.set_listener(
+            lambda progress: PlanListeners(
+                PlanStats(schedule, progress),
+                PlanAnalytics(schedule, progress, study_time, task_pages),
+                ChapterIndex(schedule, progress),
+                BacklogIndex(schedule, progress),
+            )
+        ).listeners
+        self.generation = next(_generations)
+
+def _build_user_state(user_id):
+    schedule, _ = load_or_generate_schedule(user_id)
+    return UserState(user_id, schedule, load_progress(user_id))
+
+def _save_evicted(user_id, state):
+    # A mark whose save failed is still dirty — retry it before dropping the map
+    if state.completion_status.dirty:
+        save_progress(state.completion_status, user_id)
+
+# The USER_CACHE_SIZE most recently active users' state; the rest are rebuilt
+# (from their schedule snapshot and progress rows) on their next request
+user_states = LRUCache(USER_CACHE_SIZE, on_evict=_save_evicted)
+
+def _user_state(user_id):
+    return user_states.get_or_create(user_id, lambda: _build_user_state(user_id))
+
+async def _user_state_async(user_id):
+    """_user_state without blocking the event loop when it has to build."""
+    state = user_states.get(user_id)
+    if state is None:
+        state = await run_in_threadpool(_user_state, user_id)
+    return state
+
+_USER_ID_RE = re.compile(r"^[A-Za-z0-9_.@-]{1,64}$")
+
+async def current_user(x_planner_user: Optional[str] = Header(None)):
+    """The user namespace a request acts on, from the X-Planner-User header;
+    without one it is DEFAULT_USER. This separates state, it doesn't
+    authenticate — put the service behind something that does. It only
+    checks a header, so it is `async def`: a plain `def` dependency would
+    cost every request a threadpool hop."""
+    if x_planner_user is None:
+        return DEFAULT_USER
+    if not _USER_ID_RE.match(x_planner_user):
+        raise HTTPException(status_code=400, detail="X-Planner-User must be 1..64 of [A-Za-z0-9_.@-]")
+    return x_planner_user
 
 # Load persistent status
-completion_status = load_progress()
-schedule_cache = generate_schedule()
+with _startup_phase("load_progress"):
+    _default_progress = load_progress()
 
+# A cold start serves the persisted plan when its config fingerprint matches
+with _startup_phase("schedule"):
+    _default_schedule, startup_report["schedule_source"] = load_or_generate_schedule()
 
-def _fire_daily_notification():
-    """Called by APScheduler every day at 06:00 IST — best effort only, since
-    a sleeping free-tier instance may not be running. The GitHub Actions cron
-    is the reliable trigger; both share the same once-per-day guard."""
-    topic = get_preference("ntfy_topic")
-    if not topic:
-        return
-    today_ist = datetime.datetime.now(tz=zoneinfo.ZoneInfo("Asia/Kolkata")).date().isoformat()
-    if get_preference("last_notified") == today_ist:
-        return
-    # Regenerate schedule so the job always uses fresh date-based data
-    current_schedule = generate_schedule()
-    current_status = load_progress()
-    result = send_daily_notification(current_schedule, current_status, topic)
-    if result.get("status") == "sent":
-        set_preference("last_notified", today_ist)
+user_states.get_or_create(
+    DEFAULT_USER, lambda: UserState(DEFAULT_USER, _default_schedule, _default_progress)
+)
+del _default_progress, _default_schedule
 
 
-# Set up daily scheduler — fires at 06:00 every day
-scheduler = BackgroundScheduler(timezone="Asia/Kolkata")
-scheduler.add_job(
-    _fire_daily_notification,
-    trigger=CronTrigger(hour=6, minute=0),
-    id="daily_notification",
-    replace_existing=True,
+def _fire_daily_notification():
+    """Called by APScheduler every day at 06:00 IST for each user with an
+    ntfy topic — best effort only, since a sleeping free-tier instance may not
+    be running. The GitHub Actions cron is the reliable trigger; both share
+    the same once-per-day guard."""
+    today_ist = datetime.datetime.now(tz=zoneinfo.ZoneInfo("Asia/Kolkata")).date().isoformat()
+    for user_id, topic in load_preference_users("ntfy_topic").items():
+        if get_preference("last_notified", user_id=user_id) == today_ist:
+            continue
+        result = send_daily_notification(_user_state(user_id).backlog, topic)
+        if result.get("status") == "sent":
+            set_preference("last_notified", today_ist, user_id=user_id)
+
+
+def _start_daily_scheduler():
+    """Set up the daily scheduler — fires at 06:00 every day. Runs on a
+    background thread so importing APScheduler (and tzlocal behind it) stays
+    off the cold-start path."""
+    t0 = time.perf_counter()
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
+    scheduler = BackgroundScheduler(timezone="Asia/Kolkata")
+    scheduler.add_job(
+        _fire_daily_notification,
+        trigger=CronTrigger(hour=6, minute=0),
+        id="daily_notification",
+        replace_existing=True,
+    )
+    scheduler.start()
+    atexit.register(lambda: scheduler.shutdown(wait=False))
+    startup_report["phases"]["daily_scheduler (background)"] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+threading.Thread(target=_start_daily_scheduler, name="daily-scheduler-start", daemon=True).start()
+atexit.register(close_pool)
+atexit.register(forecast.shutdown)
+
+startup_report["ready_ms"] = round((time.perf_counter() - _PROCESS_T0) * 1000, 1)
+print(
+    "Startup: " + ", ".join(f"{name} {ms}ms" for name, ms in startup_report["phases"].items())
+    + f" — ready in {startup_report['ready_ms']}ms (schedule from {startup_report['schedule_source']})"
 )
-scheduler.start()
-atexit.register(lambda: scheduler.shutdown(wait=False))
 
 
+# I/O-bound endpoints are `async def` and await async_storage, whose DB work
+# runs on its own executor sized to the connection pool. Stats is `async def`
+# too, since its counters are kept current by each mark and reading them is
+# cheap. Endpoints that are CPU-bound over the in-memory plan (plan, replan
+# preview) or block on outside I/O (notify) stay plain `def`, so FastAPI runs
+# them on its threadpool instead of the event loop.
+
 @app.get("/api/health")
-def health():
+async def health():
     return {"status": "ok"}
 
+@app.get("/api/metrics")
+async def metrics():
+    """Runtime counters for the storage layer."""
+    return {
+        "db_pool": pool_stats(),
+        "db_executor": db.executor_stats(),
+        "group_commit": group_commit_stats(),
+        "table_cache": cache_stats(),
+        "user_states": user_states.stats(),
+        "schedule_memo": schedule_memo_stats(),
+        "startup": startup_report,
+    }
+
+# Conditional GETs. Every reader's ETag is built from version counters that
+# move on each change (plan generation, ProgressMap.version, table cache
+# versions), so a matching If-None-Match is answered with 304 before any copy
+# or database read. A tag is only compared against the URL it was served for,
+# so query parameters need not be part of it. `no-cache` makes browsers
+# revalidate instead of guessing. The counters restart with the process, so
+# every tag also carries a per-boot nonce: a tag from before a restart can
+# never match a body served after it.
+_REVALIDATE = {"Cache-Control": "no-cache"}
+_BOOT_NONCE = secrets.token_hex(4)
+
+def _etag(*parts):
+    return '"' + "-".join(str(part) for part in (_BOOT_NONCE, *parts)) + '"'
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def _not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, **_REVALIDATE})
+
+def _with_etag(content, etag):
+    headers = dict(_REVALIDATE)
+    if etag is not None:
+        headers["ETag"] = etag
+    return JSONResponse(content, headers=headers)
+
+def _plan_etag(kind, state):
+    # Versions are read before the data, so a tag is never newer than its body
+    return _etag(kind, state.generation, state.completion_status.version)
+
+async def _table_response(table, user, if_none_match):
+    """A cached state table as a conditional response."""
+    cached = db.peek_versioned(table, user)
+    if cached is not None and _etag_matches(if_none_match, _etag(table, cached[1])):
+        return _not_modified(_etag(table, cached[1]))
+    data, version = await db.load_versioned(table, user)
+    return _with_etag(data, _etag(table, version))
+
+async def _range_response(table, user, if_none_match, from_date, to_date, load_range):
+    """A date-range read of a state table as a conditional response. It is
+    read from the database, but tagged with the table cache's version when
+    that cache is loaded."""
+    cached = db.peek_versioned(table, user)
+    etag = _etag(table, cached[1]) if cached is not None else None
+    if etag is not None and _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    return _with_etag(await load_range(from_date, to_date, user), etag)
+
 @app.get("/api/plan")
-def get_plan():
-    result = copy.deepcopy(schedule_cache)
-    for day in result:
-        for slot in day['slots']:
-            key = f"{day['date']}_{slot['name']}"
-            slot['completed'] = completion_status.get(key, False)
-    return result
+def get_plan(from_date: Optional[str] = Query(None, alias="from"),
+             to_date: Optional[str] = Query(None, alias="to"),
+             days: Optional[int] = Query(None, ge=1),
+             cursor: Optional[str] = None,
+             user: str = Depends(current_user),
+             if_none_match: Optional[str] = Header(None)):
+    """The plan with completion flags — all of it, or the window from `from`
+    (or a paging `cursor`) to `to`, at most `days` plan days long. When `days`
+    cut the window short of `to` (or of the plan's end), X-Next-Cursor holds
+    the cursor for the next page."""
+    if cursor is not None:
+        if from_date is not None:
+            raise HTTPException(status_code=400, detail="Pass either from or cursor, not both")
+        from_date = cursor
+    from_date, to_date = _date_range(from_date, to_date)
+    state = _user_state(user)
+    etag = _plan_etag("plan", state)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    plan = state.plan
+    start, stop, next_cursor = plan.page(from_date, to_date, days)
+    headers = {"ETag": etag, **_REVALIDATE}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    # The plan is encoded once per generation; only the flags are filled in here
+    body = plan.render(state.completion_status, start, stop)
+    return Response(body, media_type="application/json", headers=headers)
 
 @app.post("/api/mark")
-def mark_complete(date: str, slot_name: str, completed: bool):
+async def mark_complete(date: str, slot_name: str, completed: bool,
+                        user: str = Depends(current_user)):
     key = f"{date}_{slot_name}"
+    completion_status = (await _user_state_async(user)).completion_status
     completion_status[key] = completed
-    save_progress(completion_status)
+    # completion_status is a ProgressMap: this upserts just the changed key
+    await db.save_progress(completion_status, user)
     return {"status": "success"}
 
+def _date_range(from_date, to_date):
+    """Validate optional ISO `from`/`to` query bounds; returns them unchanged."""
+    for name, value in (("from", from_date), ("to", to_date)):
+        if value is None:
+            continue
+        try:
+            datetime.date.fromisoformat(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"{name} must be an ISO date (YYYY-MM-DD)")
+    if from_date and to_date and from_date > to_date:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    return from_date, to_date
+
 @app.get("/api/marks")
-def get_marks(prefix: str = ""):
-    """Return the subset of completion_status whose keys start with `prefix`.
-    A prefix (1..64 chars) is required so this never dumps the full store."""
-    if not (1 <= len(prefix) <= 64):
+async def get_marks(prefix: str = "", from_date: Optional[str] = Query(None, alias="from"),
+                    to_date: Optional[str] = Query(None, alias="to"),
+                    user: str = Depends(current_user),
+                    if_none_match: Optional[str] = Header(None)):
+    """Return the subset of the user's completion_status whose keys start with
+    `prefix`, or whose date falls in the inclusive `from`..`to` range, or both. Both are
+    answered from the sorted key index in O(log n + k). A prefix (1..64
+    chars) or a range bound is required so this never dumps the full store."""
+    from_date, to_date = _date_range(from_date, to_date)
+    if len(prefix) > 64 or not (prefix or from_date or to_date):
         raise HTTPException(status_code=400, detail="prefix must be 1..64 chars")
-    return {k: v for k, v in completion_status.items() if k.startswith(prefix)}
+    completion_status = (await _user_state_async(user)).completion_status
+    etag = _etag("marks", completion_status.version)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    if from_date or to_date:
+        marks = completion_status.date_range_items(from_date, to_date)
+        return _with_etag({k: v for k, v in marks.items() if k.startswith(prefix)}, etag)
+    return _with_etag(completion_status.prefix_items(prefix), etag)
 
 @app.get("/api/stats")
-def get_stats():
-    # Build stats dynamically from whatever subjects appear in the schedule
-    stats = {}
+async def get_stats(user: str = Depends(current_user),
+                    if_none_match: Optional[str] = Header(None)):
+    """Per-subject block, page and minute totals with their completed share,
+    and the subjects with every block done. The counters are built once per
+    plan generation and kept current by each mark."""
+    state = await _user_state_async(user)
+    etag = _plan_etag("stats", state)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    return _with_etag(state.stats.snapshot(), etag)
+
+# Forecasts per (user, plan generation, progress version, study-time version,
+# day, trials): any mark or logged study time makes a fresh one
+_forecasts = LRUCache(USER_CACHE_SIZE)
+
+@app.get("/api/forecast")
+async def get_forecast(trials: int = Query(forecast.FORECAST_TRIALS, ge=100, le=20000),
+                       user: str = Depends(current_user)):
+    """Monte Carlo finish dates per subject (10th/50th/90th percentile), from
+    the pace observed on completed, well-studied blocks. Time-boxed: "trials"
+    says how many simulations made it into the answer."""
+    state = await _user_state_async(user)
+    study_time, study_version = await db.load_versioned("study_time", user)
+    today = datetime.date.today()
+    key = (user, state.generation, state.completion_status.version, study_version, today.isoformat(), trials)
+
+    def compute():
+        inputs = forecast.build_inputs(state.schedule, state.completion_status, study_time, today)
+        return forecast.run(inputs, today, trials)
+
+    cached = _forecasts.get(key)
+    if cached is not None:
+        return cached
+    result = await run_in_threadpool(compute)
+    # A time-boxed partial answer isn't kept: the next request tries again
+    if result["complete"]:
+        _forecasts.get_or_create(key, lambda: result)
+    return result
 
-    for day in schedule_cache:
-        for slot in day['slots']:
-            subj = slot['subject']
-            if subj in ("Revision", "Buffer"):
-                continue
-            if subj not in stats:
-                stats[subj] = {"total": 0, "completed": 0}
-            stats[subj]["total"] += 1
-            key = f"{day['date']}_{slot['name']}"
-            if completion_status.get(key, False):
-                stats[subj]["completed"] += 1
-
-    completed_subjects = [subj for subj, s in stats.items() if s["total"] > 0 and s["completed"] == s["total"]]
-    return {
-        "stats": stats,
-        "completed_subjects": completed_subjects
-    }
+@app.get("/api/analytics")
+async def get_analytics(from_date: Optional[str] = Query(None, alias="from"),
+                        to_date: Optional[str] = Query(None, alias="to"),
+                        group: str = Query("day", regex="^(day|week)$"),
+                        subject: Optional[str] = None,
+                        user: str = Depends(current_user),
+                        if_none_match: Optional[str] = Header(None)):
+    """Per-subject pages, planned minutes, studied seconds and completion by
+    day or by (Monday-start) week, for periods starting within the inclusive
+    `from`..`to` range, with totals. Maintained as marks, study time and task
+    pages are written, so this reads summaries instead of raw history."""
+    from_date, to_date = _date_range(from_date, to_date)
+    state = await _user_state_async(user)
+    etag = _etag("analytics", state.generation, state.analytics.version)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    return _with_etag(state.analytics.query(from_date, to_date, group, subject), etag)
+
+@app.get("/api/chapters/completed")
+async def get_completed_chapters(subject: Optional[str] = None,
+                                 user: str = Depends(current_user),
+                                 if_none_match: Optional[str] = Header(None)):
+    """Fully-read chapters — every block reading them is done — with the date
+    of their last block, oldest first (as revision.chapterCompletions()).
+    Served from an index the marks keep current, not a plan scan."""
+    state = await _user_state_async(user)
+    etag = _etag("chapters", state.generation, state.chapters.version)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    return _with_etag(state.chapters.completed(subject), etag)
+
+def _mirror_write(user, table, mode, key, value):
+    """Fold a persisted study-time or task-page write into the user's cached
+    analytics (marks reach it through the ProgressMap). A user without cached
+    state reads the write from the table when their state is rebuilt."""
+    state = user_states.peek(user)
+    if state is None:
+        return
+    if table == "study_time":
+        state.analytics.study_time_changed(key, value)
+    elif table == "task_pages":
+        state.analytics.task_page_changed(key, value, exact=(mode == "set"))
+
+def _study_time_error(key, seconds):
+    if seconds is None or seconds < 0 or seconds > 24 * 3600 * 90 or key is None or len(key) > 255:
+        return "Invalid study-time payload"
+    return None
+
+def _task_page_error(key, page):
+    if page is None or page <= 0 or page >= 100000 or key is None or len(key) > 255:
+        return "Invalid task-pages payload"
+    return None
+
+def _revision_error(key, done):
+    if not key or len(key) > 255 or done is None:
+        return "Invalid revisions payload"
+    return None
+
+def _review_error(key, state):
+    if not key or len(key) > 255 or state is None:
+        return "Invalid review key"
+    return None
+
+def _confidence_error(key, level):
+    if not key or len(key) > 255:
+        return "Invalid confidence key"
+    if level not in CONFIDENCE_LEVELS:
+        return f"level must be one of {sorted(CONFIDENCE_LEVELS)}"
+    return None
 
 @app.get("/api/study-time")
-def get_study_time():
-    """All studied seconds, keyed "date_slot"."""
-    return load_study_time()
+async def get_study_time(from_date: Optional[str] = Query(None, alias="from"),
+                         to_date: Optional[str] = Query(None, alias="to"),
+                         user: str = Depends(current_user),
+                         if_none_match: Optional[str] = Header(None)):
+    """All studied seconds, keyed "date_slot" — or only those dated within
+    the inclusive `from`..`to` range."""
+    from_date, to_date = _date_range(from_date, to_date)
+    if from_date or to_date:
+        return await _range_response("study_time", user, if_none_match,
+                                     from_date, to_date, db.load_study_time_range)
+    return await _table_response("study_time", user, if_none_match)
 
 @app.post("/api/study-time")
-def post_study_time(key: str, seconds: int):
+async def post_study_time(key: str, seconds: int, user: str = Depends(current_user)):
     """Record total studied seconds for a task (monotonic upsert)."""
-    if seconds < 0 or seconds > 24 * 3600 * 90 or len(key) > 255:
-        raise HTTPException(status_code=400, detail="Invalid study-time payload")
-    set_study_time(key, seconds)
+    error = _study_time_error(key, seconds)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    await db.set_study_time(key, seconds, user)
+    _mirror_write(user, "study_time", "max", key, seconds)
     return {"status": "success", "key": key, "seconds": seconds}
 
 @app.get("/api/task-pages")
-def get_task_pages():
-    """All last-page-reached records, keyed "date_slot"."""
-    return load_task_pages()
+async def get_task_pages(from_date: Optional[str] = Query(None, alias="from"),
+                         to_date: Optional[str] = Query(None, alias="to"),
+                         user: str = Depends(current_user),
+                         if_none_match: Optional[str] = Header(None)):
+    """All last-page-reached records, keyed "date_slot" — or only those dated
+    within the inclusive `from`..`to` range."""
+    from_date, to_date = _date_range(from_date, to_date)
+    if from_date or to_date:
+        return await _range_response("task_pages", user, if_none_match,
+                                     from_date, to_date, db.load_task_pages_range)
+    return await _table_response("task_pages", user, if_none_match)
 
 @app.post("/api/task-pages")
-def post_task_page(key: str, page: int, exact: bool = False):
+async def post_task_page(key: str, page: int, exact: bool = False,
+                         user: str = Depends(current_user)):
     """Record the last page reached for a task.
 
     Monotonic by default; `exact=true` overwrites so a deliberate edit can
     also correct the page downwards."""
-    if page <= 0 or page >= 100000 or len(key) > 255:
-        raise HTTPException(status_code=400, detail="Invalid task-pages payload")
-    set_task_page(key, page, exact=exact)
+    error = _task_page_error(key, page)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    await db.set_task_page(key, page, exact=exact, user_id=user)
+    _mirror_write(user, "task_pages", "set" if exact else "max", key, page)
     return {"status": "success", "key": key, "page": page}
 
 @app.get("/api/revisions")
-def get_revisions():
+async def get_revisions(user: str = Depends(current_user),
+                        if_none_match: Optional[str] = Header(None)):
     """All revision done-flags, keyed by revision key."""
-    return load_revisions()
+    return await _table_response("revisions", user, if_none_match)
 
 @app.post("/api/revisions")
-def post_revision(key: str, done: bool):
+async def post_revision(key: str, done: bool, user: str = Depends(current_user)):
     """Record whether a due revision has been done."""
-    if not key or len(key) > 255:
-        raise HTTPException(status_code=400, detail="Invalid revisions payload")
-    set_revision(key, done)
+    error = _revision_error(key, done)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    await db.set_revision(key, done, user)
     return {"status": "success", "key": key, "done": done}
 
 @app.get("/api/reviews")
-def get_reviews():
+async def get_reviews(user: str = Depends(current_user),
+                      if_none_match: Optional[str] = Header(None)):
     """All SM-2 review states, keyed by chapter slug."""
-    return load_reviews()
+    return await _table_response("reviews", user, if_none_match)
+
+@app.get("/api/reviews/due")
+async def get_reviews_due(on: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=1000),
+                          user: str = Depends(current_user),
+                          if_none_match: Optional[str] = Header(None)):
+    """Reviews due on or before `on` (default today), earliest first, as
+    [{key, due, interval, ease, reps}] — at most `limit` of them."""
+    if on is None:
+        on = datetime.date.today().isoformat()
+    else:
+        try:
+            datetime.date.fromisoformat(on)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="on must be an ISO date (YYYY-MM-DD)")
+    cached = db.peek_versioned("reviews", user)
+    etag = _etag("reviews-due", on, limit, cached[1]) if cached is not None else None
+    if etag is not None and _etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    return _with_etag(await db.load_reviews_due(on, limit, user), etag)
 
 @app.post("/api/reviews")
-def post_review(review: ReviewInput):
+async def post_review(review: ReviewInput, user: str = Depends(current_user)):
     """Persist a chapter's full review state after a recall rating."""
-    if not review.key or len(review.key) > 255:
-        raise HTTPException(status_code=400, detail="Invalid review key")
-    set_review(review.key, review.state)
+    error = _review_error(review.key, review.state)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    await db.set_review(review.key, review.state, user)
     return {"status": "success", "key": review.key}
 
 @app.get("/api/confidence")
-def get_confidence():
+async def get_confidence(user: str = Depends(current_user),
+                         if_none_match: Optional[str] = Header(None)):
     """All confidence levels, keyed by chapter slug."""
-    return load_confidence()
+    return await _table_response("confidence", user, if_none_match)
 
 @app.post("/api/confidence")
-def post_confidence(key: str, level: str):
+async def post_confidence(key: str, level: str, user: str = Depends(current_user)):
     """Set a chapter's confidence level (weak|medium|strong)."""
-    if not key or len(key) > 255:
-        raise HTTPException(status_code=400, detail="Invalid confidence key")
-    if level not in CONFIDENCE_LEVELS:
-        raise HTTPException(status_code=400, detail=f"level must be one of {sorted(CONFIDENCE_LEVELS)}")
-    set_confidence(key, level)
+    error = _confidence_error(key, level)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    await db.set_confidence(key, level, user)
     return {"status": "success", "key": key, "level": level}
 
+@app.get("/api/sync")
+async def get_sync(since: int = Query(0, ge=0), user: str = Depends(current_user)):
+    """Rows of the state tables (marks, study time, task pages, revisions,
+    reviews, confidence) changed after change-log version `since` — 0 for
+    everything. Pass the returned `version` as the next `since`; on
+    `reset: true` replace local state with the response instead of merging."""
+    result = await db.load_changes(since, user)
+    if result is None:
+        raise HTTPException(status_code=500, detail="Could not read the change log")
+    return result
+
+def _batch_write(op):
+    """Validate one batch op. Returns ((table, mode, key, value), None) or
+    (None, error)."""
+    if op.op == "mark":
+        if not op.date or not op.slot_name or op.completed is None:
+            return None, "mark needs date, slot_name and completed"
+        key = f"{op.date}_{op.slot_name}"
+        if len(key) > 255:
+            return None, "Invalid mark key"
+        return ("progress", "set", key, op.completed), None
+    if op.op == "study_time":
+        error = _study_time_error(op.key, op.seconds)
+        return (None, error) if error else (("study_time", "max", op.key, op.seconds), None)
+    if op.op == "task_page":
+        error = _task_page_error(op.key, op.page)
+        mode = "set" if op.exact else "max"
+        return (None, error) if error else (("task_pages", mode, op.key, op.page), None)
+    if op.op == "revision":
+        error = _revision_error(op.key, op.done)
+        return (None, error) if error else (("revisions", "set", op.key, op.done), None)
+    if op.op == "review":
+        error = _review_error(op.key, op.state)
+        return (None, error) if error else (("reviews", "set", op.key, op.state), None)
+    if op.op == "confidence":
+        error = _confidence_error(op.key, op.level)
+        return (None, error) if error else (("confidence", "set", op.key, op.level), None)
+    return None, f"Unknown op: {op.op}"
+
+@app.post("/api/batch")
+async def post_batch(batch: BatchInput, user: str = Depends(current_user)):
+    """Apply many writes (e.g. an offline device's replay queue) in one
+    transaction. Semantics match the single-write endpoints: study time and
+    task pages are monotonic unless `exact`, everything else overwrites.
+
+    Invalid ops are reported and skipped; the valid ones commit together, or —
+    if the transaction fails — not at all (500)."""
+    if len(batch.ops) > MAX_BATCH_OPS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_OPS} ops per batch")
+
+    results = []
+    writes = []
+    for index, op in enumerate(batch.ops):
+        write, error = _batch_write(op)
+        if error:
+            results.append({"index": index, "op": op.op, "status": "error", "detail": error})
+            continue
+        writes.append(write)
+        results.append({"index": index, "op": op.op, "status": "success", "key": write[2]})
+
+    if not await db.apply_batch(writes, user):
+        raise HTTPException(status_code=500, detail="Batch write failed; nothing was applied")
+
+    # Marks are persisted already — mirror them without re-dirtying the map.
+    # A user whose state isn't cached will load them with the rest.
+    state = user_states.peek(user)
+    for table, mode, key, value in writes:
+        if table == "progress" and state is not None:
+            state.completion_status.set_saved(key, value)
+        else:
+            _mirror_write(user, table, mode, key, value)
+    return {"status": "success", "applied": len(writes), "results": results}
+
 @app.get("/api/preferences/{key}")
-def get_pref_api(key: str):
-    val = get_preference(key)
-    return {"key": key, "value": val}
+async def get_pref_api(key: str, user: str = Depends(current_user),
+                       if_none_match: Optional[str] = Header(None)):
+    cached = db.peek_versioned("preferences", user)
+    if cached is not None and _etag_matches(if_none_match, _etag("preferences", cached[1])):
+        return _not_modified(_etag("preferences", cached[1]))
+    prefs, version = await db.load_versioned("preferences", user)
+    return _with_etag({"key": key, "value": prefs.get(key)}, _etag("preferences", version))
 
 @app.post("/api/preferences")
-def set_pref_api(pref: PreferenceInput):
+async def set_pref_api(pref: PreferenceInput, user: str = Depends(current_user)):
     if pref.key not in ALLOWED_PREF_KEYS:
         raise HTTPException(status_code=400, detail=f"Unknown preference key: {pref.key}")
-    set_preference(pref.key, pref.value)
+    await db.set_preference(pref.key, pref.value, user)
     return {"status": "success", "key": pref.key, "value": pref.value}
 
-_PAGE_RE = re.compile(r"pp\.(\d+)-(\d+)")
-
-
-def _compute_replan_preview():
+def _compute_replan_preview(state):
     """Simulate a fresh plan starting TODAY, folding every unread page (all
     catch-up backlog first, then upcoming) back into the schedule. No side effects.
 
@@ -239,20 +716,20 @@ def _compute_replan_preview():
     earliest_unread = {}  # subject -> min start page across INCOMPLETE slots
     max_completed = {}    # subject -> max end page across COMPLETED slots
 
-    for day in schedule_cache:
+    completion_status = state.completion_status
+    for day in state.schedule:
         for slot in day['slots']:
             subj = slot['subject']
             if subj in ("Revision", "Buffer"):
                 continue
-            ranges = _PAGE_RE.findall(slot.get('task', ''))
+            ranges = page_ranges(slot)
             if not ranges:
                 continue
-            fp = min(int(a) for a, _ in ranges)
+            fp = min(a for a, _ in ranges)
             if subj not in first_page or fp < first_page[subj]:
                 first_page[subj] = fp
-            key = f"{day['date']}_{slot['name']}"
-            if completion_status.get(key, False):
-                mx = max(int(b) for _, b in ranges)
+            if completion_status.is_completed(day['date'], slot['name']):
+                mx = max(b for _, b in ranges)
                 if subj not in max_completed or mx > max_completed[subj]:
                     max_completed[subj] = mx
             else:
@@ -282,51 +759,47 @@ def _compute_replan_preview():
 
 
 @app.get("/api/replan/preview")
-def replan_preview():
+def replan_preview(user: str = Depends(current_user)):
     """Preview a replan-from-today without touching anything."""
-    return _compute_replan_preview()
+    return _compute_replan_preview(_user_state(user))
 
 
 @app.post("/api/replan")
-def replan():
+async def replan(user: str = Depends(current_user)):
     """Apply a replan: persist the new start date + resume pages and rebuild
-    the cached schedule. Completion data is never touched. Once per day."""
-    global schedule_cache
+    the user's cached schedule. Completion data is never touched. Once per day."""
     today_iso = datetime.date.today().isoformat()
-    if get_preference("last_replan") == today_iso:
+    if await db.get_preference("last_replan", user_id=user) == today_iso:
         raise HTTPException(status_code=409, detail="Already replanned today")
 
-    preview = _compute_replan_preview()
-    set_preference("schedule_start", preview["start"])
-    set_preference("resume_pages", json.dumps(preview["resume_pages"]))
-    set_preference("last_replan", today_iso)
-    schedule_cache = generate_schedule()
+    # Generating a plan is CPU work — keep it off the event loop
+    state = await _user_state_async(user)
+    preview = await run_in_threadpool(_compute_replan_preview, state)
+    await db.set_preference("schedule_start", preview["start"], user)
+    await db.set_preference("resume_pages", json.dumps(preview["resume_pages"]), user)
+    await db.set_preference("last_replan", today_iso, user)
+    schedule, _ = await run_in_threadpool(load_or_generate_schedule, user)
+    await run_in_threadpool(state.set_schedule, schedule)
     return {**preview, "applied": True}
 
 
 @app.post("/api/notify")
-def trigger_notification(force: bool = False):
+def trigger_notification(force: bool = False, user: str = Depends(current_user)):
     """
     Send the daily backlog notification using the saved ntfy_topic.
 
     Idempotent per day (IST) so the external cron and the in-process scheduler
     can both call it without double-notifying; pass force=true to override.
     """
-    topic = get_preference("ntfy_topic")
+    topic = get_preference("ntfy_topic", user_id=user)
     if not topic:
         raise HTTPException(status_code=400, detail="No ntfy topic configured. Save one via POST /api/preferences with key=ntfy_topic.")
 
     today_ist = datetime.datetime.now(tz=zoneinfo.ZoneInfo("Asia/Kolkata")).date().isoformat()
-    if not force and get_preference("last_notified") == today_ist:
+    if not force and get_preference("last_notified", user_id=user) == today_ist:
         return {"status": "already_sent", "date": today_ist}
 
-    current_schedule = generate_schedule()
-    current_status = load_progress()
-    result = send_daily_notification(current_schedule, current_status, topic)
+    result = send_daily_notification(_user_state(user).backlog, topic)
     if result.get("status") == "sent":
-        set_preference("last_notified", today_ist)
+        set_preference("last_notified", today_ist, user_id=user)
     return result
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
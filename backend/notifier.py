@@ -40,6 +40,26 @@ def _parse_chapters(task_text: str):
     return item_regex.findall(task_text)
 
 
+_CHAPTER_NUM_RE = re.compile(r'(\d+)\.\s*(.*)')
+
+
+def _slot_chapters(slot):
+    """
+    (num, title, pages) tuples for a slot, as _parse_chapters returns them.
+    Built from the slot's structured segments; plans generated before those
+    existed fall back to parsing the task text.
+    """
+    segments = slot.get("segments")
+    if segments is None:
+        return _parse_chapters(slot.get("task", ""))
+    out = []
+    for seg in segments:
+        m = _CHAPTER_NUM_RE.match(seg["chapter"])
+        if m:
+            out.append((m.group(1), m.group(2).strip(), f"pp.{seg['start']}-{seg['end']}"))
+    return out
+
+
 def _build_chapters_block(matches) -> str:
     """
     Single-line format per chapter, no blank lines between entries:
@@ -54,74 +74,25 @@ def _build_chapters_block(matches) -> str:
     return "\n".join(lines)
 
 
-def get_today_backlog_notification(schedule_cache, completion_status):
+def get_today_backlog_notification(backlog):
     """
     Build a notification message from the top pending backlog item.
-    Priority order: Economy > Polity > History (matches frontend display order).
+    `backlog` is the plan's BacklogIndex (plan_view), kept current as marks
+    change, so this only formats its top() entry.
+    The oldest backlog block across subjects comes first; with no backlog,
+    today's first pending block in plan order.
     Returns (subject, title, message) or None if no backlog exists.
     """
-    today_str = _today_ist().isoformat()
-
-    # Collect all past incomplete slots grouped by subject. Subjects are taken
-    # from the plan itself — hardcoding them silently dropped every slot when
-    # the syllabus changed, so nothing was ever sent.
-    backlog_by_subject = {}
-
-    for day in schedule_cache:
-        if day["date"] >= today_str:
-            continue
-        for slot in day["slots"]:
-            subj = slot.get("subject")
-            if not subj or subj in ("Revision", "Buffer"):
-                continue
-            key = f"{day['date']}_{slot['name']}"
-            if not completion_status.get(key, False) and slot.get("task") != "Revision":
-                backlog_by_subject.setdefault(subj, []).append({"slot": slot, "date": day["date"]})
-
-    # Also include today's pending slots as reminders
-    today_slots = []
-    for day in schedule_cache:
-        if day["date"] == today_str:
-            for slot in day["slots"]:
-                subj = slot.get("subject")
-                if not subj or subj in ("Revision", "Buffer"):
-                    continue
-                key = f"{day['date']}_{slot['name']}"
-                if not completion_status.get(key, False) and slot.get("task") != "Revision":
-                    today_slots.append({"slot": slot, "date": day["date"], "subject": subj})
-            break
-
-    # Oldest backlog first; for today's tasks, plan order (Morning before Evening)
-    priority_order = sorted(
-        backlog_by_subject,
-        key=lambda s: backlog_by_subject[s][0]["date"],
-    )
-    is_backlog = True
-
-    chosen_subject = None
-    chosen_items = []
-
-    for subj in priority_order:
-        if backlog_by_subject[subj]:
-            chosen_subject = subj
-            chosen_items = backlog_by_subject[subj]
-            break
-
-    # If no backlog, fall back to today's tasks (first one in plan order)
-    if not chosen_subject:
-        is_backlog = False
-        if today_slots:
-            chosen_subject = today_slots[0]["subject"]
-            chosen_items = [t for t in today_slots if t["subject"] == chosen_subject]
-        if not chosen_subject:
-            return None
-
-    top_item = chosen_items[0]
-    task_text = top_item["slot"]["task"]
-    item_date = top_item["date"]
-    slot_name = top_item["slot"].get("name", "")
-
-    matches = _parse_chapters(task_text)
+    top = backlog.top(_today_ist().isoformat())
+    if top is None:
+        return None
+    chosen_subject, item_date, slot, overdue = top
+    is_backlog = overdue is not None
+
+    task_text = slot["task"]
+    slot_name = slot.get("name", "")
+
+    matches = _slot_chapters(slot)
     chapters_block = _build_chapters_block(matches)
 
     formatted_date = _fmt_date(item_date)
@@ -130,7 +101,6 @@ def get_today_backlog_notification(schedule_cache, completion_status):
     # Keep it short — ntfy shows this on the lock screen (~50 chars max)
     # The subject emoji comes from Tags, so no emoji in the title itself
     if is_backlog:
-        overdue = len(chosen_items)
         title = f"{chosen_subject} - Backlog ({overdue} pending)"
     else:
         title = f"{chosen_subject} - Today's Session"
@@ -192,12 +162,12 @@ def send_ntfy_notification(topic: str, title: str, message: str, tags: list = No
         return False
 
 
-def send_daily_notification(schedule_cache, completion_status, topic: str) -> dict:
+def send_daily_notification(backlog, topic: str) -> dict:
     """
     Compose and send the daily backlog notification.
     Returns a status dict.
     """
-    result = get_today_backlog_notification(schedule_cache, completion_status)
+    result = get_today_backlog_notification(backlog)
     if result is None:
         return {"status": "no_backlog", "message": "Nothing pending in backlog"}
 
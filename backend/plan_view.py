@@ -0,0 +1,540 @@
+"""Per-generation views of a plan, built once when the plan is generated and
+kept current as marks (and study-time / task-page writes) change:
+
+- SerializedPlan: the /api/plan body, encoded once
+- PlanStats: the /api/stats per-subject counters
+- PlanAnalytics: the /api/analytics day and week aggregates
+- ChapterIndex: fully-read chapters for /api/chapters/completed
+- BacklogIndex: the pending blocks the daily notification is built from
+
+PlanListeners fans the ProgressMap's single listener slot out to the
+others.
+
+For the plan body, only the completion flags change per request, so each
+day is serialized up front with a hole where every slot's "completed" value
+goes. Serving a plan is then a walk that drops b"true"/b"false" into the
+holes and joins bytes — no deep copy, no per-slot dicts, no jsonable_encoder
+pass.
+"""
+import bisect
+import datetime
+import json
+import re
+import threading
+
+try:
+    import orjson
+except ImportError:  # optional speedup — the stdlib encoder gives the same bytes
+    orjson = None
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes, as FastAPI's JSONResponse would render them."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# Stand-in value for a completion flag; plan text never contains NUL, and
+# both encoders render it as the same six-character escape
+_HOLE = "\x00"
+_HOLE_JSON = b'"\\u0000"'
+_TRUE = b"true"
+_FALSE = b"false"
+
+
+class SerializedPlan:
+    """A generated plan as pre-encoded JSON, day by day."""
+
+    def __init__(self, schedule):
+        self.dates = []
+        self._chunks = []  # per day: its JSON split at each slot's completed hole
+        self._slots = []   # per day: slot names, in hole order
+        for day in schedule:
+            slots = day["slots"]
+            encoded = dumps({**day, "slots": [{**slot, "completed": _HOLE} for slot in slots]})
+            chunks = encoded.split(_HOLE_JSON)
+            if len(chunks) != len(slots) + 1:
+                raise ValueError(f"Plan text for {day['date']} collides with the completion placeholder")
+            self.dates.append(day["date"])
+            self._chunks.append(chunks)
+            self._slots.append([slot["name"] for slot in slots])
+        # date -> day index, so a window is located in O(1) and sliced in O(window)
+        self.date_index = {date: i for i, date in enumerate(self.dates)}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def window(self, from_date=None, to_date=None, days=None):
+        """(start, stop) day indexes covering `from_date`..`to_date`
+        (inclusive, either open), capped at `days` plan days. Dates outside
+        the plan clamp to its ends."""
+        start = 0
+        if from_date is not None:
+            start = self.date_index.get(from_date)
+            if start is None:
+                start = bisect.bisect_left(self.dates, from_date)
+        stop = len(self.dates)
+        if to_date is not None:
+            stop = self.date_index.get(to_date)
+            stop = stop + 1 if stop is not None else bisect.bisect_right(self.dates, to_date)
+        if days is not None:
+            stop = min(stop, start + days)
+        return start, max(start, stop)
+
+    def page(self, from_date=None, to_date=None, days=None):
+        """window() plus the date the next page starts on — None unless
+        `days` cut the window short of `to_date` (or of the plan's end)."""
+        start, stop = self.window(from_date, to_date, days)
+        _, end = self.window(from_date, to_date)
+        return start, stop, self.dates[stop] if stop < end else None
+
+    def _render_day(self, i, completion_status):
+        chunks = self._chunks[i]
+        done = completion_status.day(self.dates[i])
+        parts = [chunks[0]]
+        for name, chunk in zip(self._slots[i], chunks[1:]):
+            parts.append(_TRUE if done.get(name, False) else _FALSE)
+            parts.append(chunk)
+        return b"".join(parts)
+
+    def render(self, completion_status, start=0, stop=None):
+        """JSON bytes of days[start:stop] with completion flags filled in."""
+        stop = len(self.dates) if stop is None else stop
+        return b"[" + b",".join(
+            self._render_day(i, completion_status) for i in range(start, stop)
+        ) + b"]"
+
+
+_PAGE_RE = re.compile(r"pp\.(\d+)-(\d+)")
+# One "title (pp.a-b)" piece of task text (revision.ts's SEG_RE)
+_SEGMENT_RE = re.compile(r"([^,]+?)\s*\(pp\.(\d+)\s*-\s*(\d+)\)")
+
+
+def page_ranges(slot):
+    """(first, last) page of each chapter segment a slot reads. Taken from
+    the slot's "segments"; plans generated before those existed fall back to
+    parsing the "pp.a-b" ranges out of the task text."""
+    segments = slot.get("segments")
+    if segments is not None:
+        return [(seg["start"], seg["end"]) for seg in segments]
+    return [(int(a), int(b)) for a, b in _PAGE_RE.findall(slot.get("task", ""))]
+
+# Slot subjects that are placeholders, not study work
+_NOT_STUDY = ("Revision", "Buffer")
+
+
+class PlanStats:
+    """Per-subject block, page and minute totals for a plan, with the
+    completed share of each maintained as marks flip.
+
+    Built once per plan generation from the plan and the user's ProgressMap;
+    after that it follows the map as its listener (ProgressMap.set_listener),
+    so a mark costs one dict lookup and a few additions here, and /api/stats
+    just copies the counters out.
+    """
+
+    def __init__(self, schedule, completion_status):
+        self._lock = threading.Lock()
+        self._subjects = {}  # subject -> counters, in first-seen order
+        self._slots = {}     # (date, slot name) -> (subject, pages, minutes)
+        for day in schedule:
+            done = completion_status.day(day["date"])
+            for slot in day["slots"]:
+                subject = slot["subject"]
+                if subject in _NOT_STUDY:
+                    continue
+                pages = sum(b - a + 1 for a, b in page_ranges(slot))
+                minutes = slot.get("minutes", 0)
+                self._slots[(day["date"], slot["name"])] = (subject, pages, minutes)
+                counters = self._subjects.setdefault(subject, {
+                    "total": 0, "completed": 0,
+                    "pages": 0, "pages_completed": 0,
+                    "minutes": 0, "minutes_completed": 0,
+                })
+                counters["total"] += 1
+                counters["pages"] += pages
+                counters["minutes"] += minutes
+                if done.get(slot["name"], False):
+                    counters["completed"] += 1
+                    counters["pages_completed"] += pages
+                    counters["minutes_completed"] += minutes
+        self._finished = {
+            subject for subject, c in self._subjects.items() if c["completed"] == c["total"]
+        }
+
+    def progress_changed(self, date, slot, completed):
+        info = self._slots.get((date, slot))
+        if info is None:
+            return
+        subject, pages, minutes = info
+        sign = 1 if completed else -1
+        with self._lock:
+            counters = self._subjects[subject]
+            counters["completed"] += sign
+            counters["pages_completed"] += sign * pages
+            counters["minutes_completed"] += sign * minutes
+            if counters["completed"] == counters["total"]:
+                self._finished.add(subject)
+            else:
+                self._finished.discard(subject)
+
+    def snapshot(self):
+        """The /api/stats body."""
+        with self._lock:
+            return {
+                "stats": {subject: dict(c) for subject, c in self._subjects.items()},
+                "completed_subjects": [s for s in self._subjects if s in self._finished],
+            }
+
+
+class PlanListeners:
+    """Several ProgressMap listeners in the one place set_listener fills."""
+
+    def __init__(self, *listeners):
+        self.listeners = listeners
+
+    def progress_changed(self, date, slot, completed):
+        for listener in self.listeners:
+            listener.progress_changed(date, slot, completed)
+
+
+_COUNTERS = (
+    "blocks", "completed", "pages", "pages_completed", "pages_read",
+    "minutes", "minutes_completed", "studied_seconds",
+)
+
+
+def _week_of(date):
+    """ISO date of the Monday starting `date`'s week."""
+    day = datetime.date.fromisoformat(date)
+    return (day - datetime.timedelta(days=day.weekday())).isoformat()
+
+
+class PlanAnalytics:
+    """Per-subject aggregates of a plan by day and by week: blocks, pages and
+    planned minutes with their completed share, pages read (completed blocks
+    in full, open ones up to their recorded task page) and studied seconds.
+
+    Built once per plan generation from the plan, the ProgressMap and the
+    study_time / task_pages maps. After that marks arrive as a ProgressMap
+    listener and study-time / task-page writes through study_time_changed()
+    and task_page_changed(), each moving one block's contribution in its
+    day and week buckets.
+    """
+
+    def __init__(self, schedule, completion_status, study_time, task_pages):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._slots = {}    # "date_slot" -> (date, week, subject, pages, minutes, first page)
+        self._buckets = {"day": {}, "week": {}}  # period -> {period start: {subject: counters}}
+        self._done = {}     # "date_slot" -> completed
+        self._seconds = {}  # "date_slot" -> studied seconds counted
+        self._page = {}     # "date_slot" -> task page reached
+        self._read = {}     # "date_slot" -> pages read counted
+        for day in schedule:
+            date = day["date"]
+            week = _week_of(date)
+            done = completion_status.day(date)
+            for slot in day["slots"]:
+                subject = slot["subject"]
+                if subject in _NOT_STUDY:
+                    continue
+                ranges = page_ranges(slot)
+                pages = sum(b - a + 1 for a, b in ranges)
+                minutes = slot.get("minutes", 0)
+                key = f"{date}_{slot['name']}"
+                info = self._slots[key] = (date, week, subject, pages, minutes,
+                                           min(a for a, _ in ranges) if ranges else 0)
+                completed = done.get(slot["name"], False)
+                self._done[key] = completed
+                self._page[key] = task_pages.get(key)
+                self._seconds[key] = study_time.get(key, 0)
+                self._read[key] = self._pages_read(key)
+                self._add(info, {
+                    "blocks": 1, "pages": pages, "minutes": minutes,
+                    "completed": int(completed),
+                    "pages_completed": pages if completed else 0,
+                    "minutes_completed": minutes if completed else 0,
+                    "pages_read": self._read[key],
+                    "studied_seconds": self._seconds[key],
+                })
+        self._periods = {period: sorted(buckets) for period, buckets in self._buckets.items()}
+
+    def _pages_read(self, key):
+        _, _, _, pages, _, first = self._slots[key]
+        if self._done[key]:
+            return pages
+        page = self._page[key]
+        # The stored page is the last one read (inclusive), as the client counts it
+        return min(pages, max(0, page - first + 1)) if page else 0
+
+    def _add(self, info, deltas):
+        date, week, subject = info[:3]
+        for period, start in (("day", date), ("week", week)):
+            counters = self._buckets[period].setdefault(start, {}).setdefault(
+                subject, dict.fromkeys(_COUNTERS, 0)
+            )
+            for name, delta in deltas.items():
+                counters[name] += delta
+
+    def _reread(self, key):
+        read = self._pages_read(key)
+        delta, self._read[key] = read - self._read[key], read
+        return delta
+
+    def progress_changed(self, date, slot, completed):
+        key = f"{date}_{slot}"
+        info = self._slots.get(key)
+        if info is None:
+            return
+        pages, minutes = info[3], info[4]
+        sign = 1 if completed else -1
+        with self._lock:
+            self._done[key] = completed
+            self._add(info, {
+                "completed": sign,
+                "pages_completed": sign * pages,
+                "minutes_completed": sign * minutes,
+                "pages_read": self._reread(key),
+            })
+            self.version += 1
+
+    def study_time_changed(self, key, seconds):
+        """Mirror a study_time write ("max" semantics, as stored)."""
+        info = self._slots.get(key)
+        if info is None:
+            return
+        with self._lock:
+            was = self._seconds[key]
+            if seconds > was:
+                self._seconds[key] = seconds
+                self._add(info, {"studied_seconds": seconds - was})
+                self.version += 1
+
+    def task_page_changed(self, key, page, exact=False):
+        """Mirror a task_pages write ("max" unless exact, as stored)."""
+        info = self._slots.get(key)
+        if info is None:
+            return
+        with self._lock:
+            was = self._page[key]
+            self._page[key] = page if exact or was is None else max(was, page)
+            delta = self._reread(key)
+            if delta:
+                self._add(info, {"pages_read": delta})
+                self.version += 1
+
+    def query(self, from_date=None, to_date=None, group="day", subject=None):
+        """The /api/analytics body: one row per period and subject for
+        periods starting within `from_date`..`to_date` (inclusive, either
+        open), plus per-subject totals over those rows."""
+        starts = self._periods[group]
+        if from_date and group == "week":
+            from_date = _week_of(from_date)  # include the week from_date falls in
+        lo = bisect.bisect_left(starts, from_date) if from_date else 0
+        hi = bisect.bisect_right(starts, to_date) if to_date else len(starts)
+        rows, totals = [], {}
+        with self._lock:
+            buckets = self._buckets[group]
+            for start in starts[lo:hi]:
+                for name, counters in buckets[start].items():
+                    if subject is not None and name != subject:
+                        continue
+                    rows.append({group: start, "subject": name, **counters})
+                    total = totals.setdefault(name, dict.fromkeys(_COUNTERS, 0))
+                    for counter, value in counters.items():
+                        total[counter] += value
+        return {"group": group, "rows": rows, "totals": totals}
+
+
+# Leading "N." / "N:" ordinal the scheduler prefixes onto chapter names
+_ORDINAL_RE = re.compile(r"^\s*\d+\s*[.:]\s*")
+
+
+def chapter_title(chapter):
+    return _ORDINAL_RE.sub("", chapter.strip()).strip()
+
+
+class ChapterIndex:
+    """Chapter -> how many plan blocks read it and how many of those are
+    done, for serving fully-read chapters without walking the plan.
+
+    A chapter (keyed by its title without the ordinal, as the frontend's
+    chapterCompletions() keys it) is completed once every block reading it
+    is; it counts as completed on its last block's date. Built once per plan
+    generation from the slots' segments, then kept current as a ProgressMap
+    listener — a mark touches only the chapters in that one block.
+    """
+
+    def __init__(self, schedule, completion_status):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._chapters = {}  # title -> entry, in first-seen (plan) order
+        self._slots = {}     # (date, slot name) -> titles read in that block
+        for day in schedule:
+            date = day["date"]
+            done = completion_status.day(date)
+            for slot in day["slots"]:
+                if slot["subject"] in _NOT_STUDY:
+                    continue
+                titles = []
+                for title, start, end in _slot_chapters(slot):
+                    if not title:
+                        continue
+                    entry = self._chapters.get(title)
+                    if entry is None:
+                        entry = self._chapters[title] = {
+                            "order": len(self._chapters), "subject": slot["subject"],
+                            "start": start, "end": end, "blocks": 0, "completed": 0, "last": date,
+                        }
+                    else:
+                        entry["start"] = min(entry["start"], start)
+                        entry["end"] = max(entry["end"], end)
+                        entry["last"] = date
+                    entry["blocks"] += 1
+                    if done.get(slot["name"], False):
+                        entry["completed"] += 1
+                    titles.append(title)
+                if titles:
+                    self._slots[(date, slot["name"])] = titles
+        # (completed on, plan order, title) of every fully-read chapter
+        self._completed = sorted(
+            (entry["last"], entry["order"], title)
+            for title, entry in self._chapters.items()
+            if entry["completed"] == entry["blocks"]
+        )
+
+    def progress_changed(self, date, slot, completed):
+        titles = self._slots.get((date, slot))
+        if titles is None:
+            return
+        sign = 1 if completed else -1
+        with self._lock:
+            for title in titles:
+                entry = self._chapters[title]
+                was_done = entry["completed"] == entry["blocks"]
+                entry["completed"] += sign
+                now_done = entry["completed"] == entry["blocks"]
+                if was_done != now_done:
+                    item = (entry["last"], entry["order"], title)
+                    if now_done:
+                        bisect.insort(self._completed, item)
+                    else:
+                        del self._completed[bisect.bisect_left(self._completed, item)]
+            self.version += 1
+
+    def completed(self, subject=None):
+        """Fully-read chapters, oldest completion first, in the shape of the
+        frontend's ChapterCompletion."""
+        with self._lock:
+            out = []
+            for last, _, title in self._completed:
+                entry = self._chapters[title]
+                if subject is not None and entry["subject"] != subject:
+                    continue
+                start, end = entry["start"], entry["end"]
+                out.append({
+                    "chapter": title,
+                    "subject": entry["subject"],
+                    "pages": f"pp.{start}" if start == end else f"pp.{start}-{end}",
+                    "completedOn": last,
+                })
+            return out
+
+
+class BacklogIndex:
+    """Incomplete study blocks before a given day, per subject, plus that
+    day's own pending blocks — what the daily notification is built from.
+
+    Blocks are numbered in plan order, so each subject's backlog is a sorted
+    list of block numbers and its oldest entry is the list's head. Built once
+    per plan generation, then kept current as a ProgressMap listener; a mark
+    inserts or removes one number. The day boundary moves on the first
+    top() call for a new day: blocks it passes are appended to their
+    subject's backlog, so a rollover costs only the days it crosses.
+    """
+
+    def __init__(self, schedule, completion_status):
+        self._lock = threading.Lock()
+        self._blocks = []  # (date, subject, slot) per notifiable block, in plan order
+        self._dates = []   # each block's date, for bisecting the day boundary
+        self._done = bytearray()
+        self._numbers = {}  # (date, slot name) -> block number
+        for day in schedule:
+            date = day["date"]
+            done = completion_status.day(date)
+            for slot in day["slots"]:
+                subject = slot.get("subject")
+                if not subject or subject in _NOT_STUDY or slot.get("task") == "Revision":
+                    continue
+                self._numbers[(date, slot["name"])] = len(self._blocks)
+                self._blocks.append((date, subject, slot))
+                self._dates.append(date)
+                self._done.append(done.get(slot["name"], False))
+        self._today = None
+        self._split = 0      # first block dated today or later
+        self._backlog = {}   # subject -> sorted numbers of incomplete blocks before today
+        self._pending = []   # sorted numbers of today's incomplete blocks
+
+    def _roll(self, today):
+        """Move the day boundary to `today`."""
+        if today == self._today:
+            return
+        split = bisect.bisect_left(self._dates, today)
+        if self._today is None or today < self._today:
+            self._backlog = {}
+            start = 0
+        else:
+            start = self._split
+        for n in range(start, split):
+            if not self._done[n]:
+                self._backlog.setdefault(self._blocks[n][1], []).append(n)
+        self._today, self._split = today, split
+        self._pending = [
+            n for n in range(split, bisect.bisect_right(self._dates, today)) if not self._done[n]
+        ]
+
+    def progress_changed(self, date, slot, completed):
+        n = self._numbers.get((date, slot))
+        if n is None:
+            return
+        with self._lock:
+            self._done[n] = bool(completed)
+            if n < self._split:
+                numbers = self._backlog.setdefault(self._blocks[n][1], [])
+            elif date == self._today:
+                numbers = self._pending
+            else:
+                return
+            if completed:
+                del numbers[bisect.bisect_left(numbers, n)]
+            else:
+                bisect.insort(numbers, n)
+
+    def top(self, today):
+        """The block to notify about on `today`, as (subject, date, slot,
+        backlog count): the oldest backlog block across subjects with its
+        subject's backlog size, or failing that today's first pending block
+        with a count of None. None when nothing is pending."""
+        with self._lock:
+            self._roll(today)
+            heads = [numbers[0] for numbers in self._backlog.values() if numbers]
+            if heads:
+                date, subject, slot = self._blocks[min(heads)]
+                return subject, date, slot, len(self._backlog[subject])
+            if self._pending:
+                date, subject, slot = self._blocks[self._pending[0]]
+                return subject, date, slot, None
+            return None
+
+
+def _slot_chapters(slot):
+    """(title, first page, last page) per chapter segment of a slot."""
+    segments = slot.get("segments")
+    if segments is not None:
+        return [(chapter_title(seg["chapter"]), seg["start"], seg["end"]) for seg in segments]
+    return [
+        (chapter_title(title), int(a), int(b))
+        for title, a, b in _SEGMENT_RE.findall(slot.get("task", ""))
+    ]
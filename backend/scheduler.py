@@ -1,9 +1,15 @@
 
+import bisect
 import datetime
+import hashlib
+import importlib.util
 import json
 import math
+import os
+import threading
+from array import array
 from data import subjects_data
-from storage import get_preference
+from storage import DEFAULT_USER, LRUCache, get_preference, load_schedule_snapshot, save_schedule_snapshot
 
 # Configuration
 # Rescheduled 2026-07-19: plan restarts the next day with each subject
@@ -17,6 +23,19 @@ RESUME_PAGES = {
     "Ethics": 72,
 }
 
+# Bump whenever generate_schedule's output changes for the same inputs, so
+# persisted snapshots from the old logic are regenerated instead of served.
+# 2: study slots carry structured "segments"
+SCHEDULE_VERSION = 2
+
+# Slot pipelines: slot 1 (Morning / weekend Blocks 1-2) and slot 2 (Evening /
+# Block 3) each work through their subjects in order, a successor taking over
+# when the subject before it finishes.
+PIPELINES = (
+    ("Western Philosophy", "Indian Philosophy"),
+    ("Ethics", "Art & Culture"),
+)
+
 # Page Limits
 LIMITS = {
     "Morning_Polity": 15,
@@ -43,9 +62,8 @@ def calculate_limit(tracker, slot_type, other_tracker=None, other_hardness_value
     if tracker.finished or tracker.current_chapter_idx >= len(tracker.chapters):
         min_per_page = 3 # Default to easy if finished
     else:
-        current_chapter = tracker.chapters[tracker.current_chapter_idx]
-        hardness = current_chapter.get('hardness', 1.0)
-        min_per_page = get_minutes_per_page(hardness)
+        hardness = tracker.current_hardness()
+        min_per_page = tracker.table.rates[tracker.current_chapter_idx]
 
     # 2. Slot reading time
     if slot_type == "Morning":
@@ -80,100 +98,169 @@ def calculate_limit(tracker, slot_type, other_tracker=None, other_hardness_value
         if other_hardness_value is not None:
             other_h = other_hardness_value
         elif other_tracker and not other_tracker.finished:
-            other_h = other_tracker.chapters[other_tracker.current_chapter_idx].get('hardness', 1.0)
+            other_h = other_tracker.current_hardness()
         
         if hardness >= 4 and other_h >= 4:
             adjusted_limit = math.floor(adjusted_limit * 0.85)
 
     return adjusted_limit
 
+class ChapterTable:
+    """A subject's chapter list as parallel columns, with the running sums
+    that let a tracker place itself and cut a chunk by bisection instead of
+    walking chapter by chapter.
+
+    `page_sums[i]` / `minute_sums[i]` total the pages / reading minutes of
+    chapters[:i]; `end_max[i]` is the furthest end page among chapters[:i+1]
+    (chapter ends need not be sorted).
+    """
+    __slots__ = ("names", "starts", "ends", "hardness", "rates", "end_max", "page_sums", "minute_sums")
+
+    def __init__(self, chapters):
+        self.names = [ch['chapter'] for ch in chapters]
+        self.starts = array('q', (ch['start'] for ch in chapters))
+        self.ends = array('q', (ch['end'] for ch in chapters))
+        self.hardness = array('d', (ch.get('hardness', 1.0) for ch in chapters))
+        self.rates = array('q', (get_minutes_per_page(h) for h in self.hardness))
+        self.end_max = array('q')
+        self.page_sums = array('q', [0])
+        self.minute_sums = array('q', [0])
+        for i, (start, end, rate) in enumerate(zip(self.starts, self.ends, self.rates)):
+            if end < start:
+                raise ValueError(f"Chapter {self.names[i]!r} ends (p.{end}) before it starts (p.{start})")
+            pages = end - start + 1
+            self.end_max.append(max(end, self.end_max[-1]) if i else end)
+            self.page_sums.append(self.page_sums[-1] + pages)
+            self.minute_sums.append(self.minute_sums[-1] + pages * rate)
+
+    def __len__(self):
+        return len(self.names)
+
+
+# One table per chapter list — the syllabus lists live for the process
+_chapter_tables = {}
+
+
+def chapter_table(chapters):
+    entry = _chapter_tables.get(id(chapters))
+    if entry is None or entry[0] is not chapters:
+        entry = _chapter_tables[id(chapters)] = (chapters, ChapterTable(chapters))
+    return entry[1]
+
+
+class Chunk:
+    """One slot's worth of reading: `pieces` are (chapter index, first page,
+    last page) runs. The task text is only rendered when asked for."""
+    __slots__ = ("table", "pieces", "pages", "minutes")
+
+    def __init__(self, table, pieces, pages, minutes):
+        self.table = table
+        self.pieces = pieces
+        self.pages = pages
+        self.minutes = minutes
+
+    def text(self):
+        names = self.table.names
+        return ", ".join(f"{names[i]} (pp.{a}-{b})" for i, a, b in self.pieces)
+
+    def segments(self):
+        """The pieces as slot "segments": chapter, page range and minutes."""
+        names, rates = self.table.names, self.table.rates
+        return [
+            {"chapter": names[i], "start": a, "end": b, "minutes": (b - a + 1) * rates[i]}
+            for i, a, b in self.pieces
+        ]
+
+
 class SubjectTracker:
+    __slots__ = ("name", "chapters", "table", "current_chapter_idx", "current_page", "finished", "last_chunk_minutes")
+
     def __init__(self, name, chapters, start_from_page=None):
         self.name = name
         self.chapters = chapters
+        self.table = chapter_table(chapters)
         self.current_chapter_idx = 0
         self.current_page = chapters[0]['start'] if chapters else 0
         self.finished = False
+        self.last_chunk_minutes = 0
 
         if start_from_page:
-            # Fast forward logic
-            # Find which chapter contains start_from_page
-            found = False
-            for idx, ch in enumerate(self.chapters):
-                # Check if start_from_page is within this chapter or before it?
-                # Actually, simply: if start_from_page is > ch['end'], we skip this chapter entirely.
-                # If start_from_page is specifically IN this chapter, we start there.
-                
-                if start_from_page > ch['end']:
-                    continue
-                elif start_from_page >= ch['start']:
-                    self.current_chapter_idx = idx
-                    self.current_page = start_from_page
-                    found = True
-                    break
-                else: 
-                    # start_from_page < ch['start'] (gap?) -> Should just start at ch['start']
-                    # This happens if we finished prev chapter at 100, and next starts at 105, and we ask to start at 101.
-                    # We should just jump to this chapter's start.
-                    self.current_chapter_idx = idx
-                    self.current_page = ch['start']
-                    found = True
-                    break
-            
-            if not found:
+            # Fast forward to the first chapter not wholly before start_from_page,
+            # starting at that page or, if it falls in a gap, at the chapter's start
+            idx = bisect.bisect_left(self.table.end_max, start_from_page)
+            if idx < len(self.table):
+                self.current_chapter_idx = idx
+                self.current_page = max(start_from_page, self.table.starts[idx])
+            else:
                 # Means start_from_page is > last chapter's end
                 self.finished = True
                 self.current_chapter_idx = len(self.chapters) # Boundary safety
 
-    def get_next_chunk(self, max_pages):
-        # Estimated reading minutes for the chunk (by chapter hardness) is
-        # exposed via self.last_chunk_minutes after each call.
+    def current_hardness(self):
+        return self.table.hardness[self.current_chapter_idx]
+
+    def next_chunk(self, max_pages):
+        """Take up to max_pages pages, finishing chapters in order. Returns a
+        Chunk (None once finished); its minutes are also left in
+        self.last_chunk_minutes."""
         self.last_chunk_minutes = 0
         if self.finished:
             return None
-
-        chunk_pages = 0
-        desc_parts = []
-
-        while chunk_pages < max_pages and not self.finished:
-            chapter = self.chapters[self.current_chapter_idx]
-            end_page = chapter['end']
-            remaining_in_chapter = end_page - self.current_page + 1
-            min_per_page = get_minutes_per_page(chapter.get('hardness', 1.0))
-
-            can_take = max_pages - chunk_pages
-
-            if remaining_in_chapter <= can_take:
-                # Finish this chapter
-                desc_parts.append(f"{chapter['chapter']} (pp.{self.current_page}-{end_page})")
-                chunk_pages += remaining_in_chapter
-                self.last_chunk_minutes += remaining_in_chapter * min_per_page
-                self.current_chapter_idx += 1
-                if self.current_chapter_idx >= len(self.chapters):
-                    self.finished = True
-                    self.current_page = 0 # Done
-                else:
-                    self.current_page = self.chapters[self.current_chapter_idx]['start']
-            else:
+        if max_pages <= 0:
+            return Chunk(self.table, [], 0, 0)
+
+        table = self.table
+        idx, page = self.current_chapter_idx, self.current_page
+        head = table.ends[idx] - page + 1
+        if head > max_pages:
+            # Partial chapter
+            self.current_page = page + max_pages
+            minutes = max_pages * table.rates[idx]
+            self.last_chunk_minutes = minutes
+            return Chunk(table, [(idx, page, page + max_pages - 1)], max_pages, minutes)
+
+        # Finish this chapter, then every following chapter that still fits
+        # whole: the last one is found on the running page total
+        pieces = [(idx, page, table.ends[idx])]
+        budget = max_pages - head + table.page_sums[idx + 1]
+        stop = bisect.bisect_right(table.page_sums, budget, idx + 1) - 1
+        pieces.extend((i, table.starts[i], table.ends[i]) for i in range(idx + 1, stop))
+        pages = head + table.page_sums[stop] - table.page_sums[idx + 1]
+        minutes = head * table.rates[idx] + table.minute_sums[stop] - table.minute_sums[idx + 1]
+
+        if stop >= len(table):
+            self.finished = True
+            self.current_chapter_idx = stop
+            self.current_page = 0 # Done
+        else:
+            self.current_chapter_idx = stop
+            self.current_page = table.starts[stop]
+            if pages < max_pages:
                 # Partial chapter
-                take_pages = can_take
-                chunk_end = self.current_page + take_pages - 1
-                desc_parts.append(f"{chapter['chapter']} (pp.{self.current_page}-{chunk_end})")
-                self.current_page += take_pages
-                chunk_pages += take_pages
-                self.last_chunk_minutes += take_pages * min_per_page
+                take = max_pages - pages
+                pieces.append((stop, self.current_page, self.current_page + take - 1))
+                self.current_page += take
+                pages += take
+                minutes += take * table.rates[stop]
+
+        self.last_chunk_minutes = minutes
+        return Chunk(table, pieces, pages, minutes)
 
-        return ", ".join(desc_parts)
+    def get_next_chunk(self, max_pages):
+        # Estimated reading minutes for the chunk (by chapter hardness) is
+        # exposed via self.last_chunk_minutes after each call.
+        chunk = self.next_chunk(max_pages)
+        return chunk.text() if chunk is not None else None
 
-def _resolve_config(start_date, resume_pages):
-    """Resolve the effective start date and resume-page map.
+def _resolve_config(start_date, resume_pages, user_id=DEFAULT_USER):
+    """Resolve the effective start date and resume-page map for a user.
 
     Precedence: explicit kwarg > DB preference > module-level constant.
     The module constants (START_DATE / RESUME_PAGES) remain the documented
     defaults used when nothing is stored and nothing is passed in.
     """
     if start_date is None:
-        override = get_preference("schedule_start")
+        override = get_preference("schedule_start", user_id=user_id)
         if override:
             try:
                 start_date = datetime.date.fromisoformat(override)
@@ -183,7 +270,7 @@ def _resolve_config(start_date, resume_pages):
             start_date = START_DATE
 
     if resume_pages is None:
-        override = get_preference("resume_pages")
+        override = get_preference("resume_pages", user_id=user_id)
         if override:
             try:
                 parsed = json.loads(override)
@@ -199,32 +286,121 @@ def _resolve_config(start_date, resume_pages):
     return start_date, resume_pages
 
 
-def generate_schedule(start_date=None, resume_pages=None):
-    # Slot 1: Western Philosophy -> Indian Philosophy
-    # Slot 2: Ethics -> Art & Culture
-    # Each slot has a successor that takes over when the current subject finishes.
+# Generated plans are memoized per (start date, resume pages). The engine's
+# other inputs are the module-level syllabus and LIMITS, fixed at import, so
+# their hash is taken once and folded into every key.
+_ENGINE_FINGERPRINT = hashlib.sha256(
+    json.dumps({"subjects": subjects_data, "limits": LIMITS}, sort_keys=True).encode("utf-8")
+).hexdigest()
 
-    start_date, resume_pages = _resolve_config(start_date, resume_pages)
+SCHEDULE_MEMO_SIZE = 32
 
-    # Define slot pipelines: each slot has an ordered list of subjects
-    slot1_pipeline = [
-        SubjectTracker("Western Philosophy", subjects_data["Western Philosophy"],
-                       start_from_page=resume_pages.get("Western Philosophy")),
-        SubjectTracker("Indian Philosophy", subjects_data["Indian Philosophy"],
-                       start_from_page=resume_pages.get("Indian Philosophy")),
-    ]
-    slot2_pipeline = [
-        SubjectTracker("Ethics", subjects_data["Ethics"],
-                       start_from_page=resume_pages.get("Ethics")),
-        SubjectTracker("Art & Culture", subjects_data["Art & Culture"],
-                       start_from_page=resume_pages.get("Art & Culture")),
+# "python" (default) steps SubjectTrackers day by day; "numpy" runs the
+# vectorized engine in scheduler_numpy.py, which gives the same plans and is
+# faster on very large syllabi. Needs numpy installed.
+SCHEDULE_ENGINE = os.environ.get("SCHEDULE_ENGINE", "python").strip().lower() or "python"
+
+
+class _PlanRun:
+    """A generated plan and, per day, the tracker state it was built from."""
+    __slots__ = ("days", "states")
+
+    def __init__(self, days, states):
+        self.days = days
+        self.states = states
+
+
+# Day checkpoints of the memoized runs: (weekday, tracker states) -> (run,
+# day index). What a day holds depends only on the trackers' positions and
+# the weekday, so any later generation that reaches a checkpointed state can
+# take the rest of that run — shifted by whole weeks — instead of stepping
+# through it day by day.
+_checkpoints = {}
+_checkpoints_lock = threading.Lock()
+_checkpoint_stats = {"hits": 0, "days_reused": 0}
+
+
+def _forget_checkpoints(_key, run):
+    with _checkpoints_lock:
+        for state in run.states:
+            if _checkpoints.get(state, (None,))[0] is run:
+                del _checkpoints[state]
+
+
+_plan_memo = LRUCache(SCHEDULE_MEMO_SIZE, on_evict=_forget_checkpoints)
+
+
+def _remember_checkpoints(run):
+    with _checkpoints_lock:
+        for i, state in enumerate(run.states):
+            _checkpoints[state] = (run, i)
+
+
+def _find_checkpoint(state):
+    with _checkpoints_lock:
+        return _checkpoints.get(state)
+
+
+def _shift_days(days, offset):
+    """`days` moved `offset` (a whole number of weeks) later; slots are shared."""
+    if not offset:
+        return list(days)
+    return [
+        {**day, "date": (datetime.date.fromisoformat(day["date"]) + offset).isoformat()}
+        for day in days
     ]
 
+
+def schedule_memo_stats():
+    """Counters for the plan memo and its day checkpoints."""
+    with _checkpoints_lock:
+        checkpoints = {"size": len(_checkpoints), **_checkpoint_stats}
+    return {**_plan_memo.stats(), "checkpoints": checkpoints}
+
+
+def generate_schedule(start_date=None, resume_pages=None, user_id=DEFAULT_USER):
+    """The plan for a start date and resume-page map (resolved per user when
+    not given). Results are memoized and shared between callers, so treat the
+    returned list as read-only."""
+    start_date, resume_pages = _resolve_config(start_date, resume_pages, user_id)
+    key = (start_date, tuple(sorted(resume_pages.items())), _ENGINE_FINGERPRINT)
+    return _plan_memo.get_or_create(key, lambda: _ENGINES[SCHEDULE_ENGINE](start_date, resume_pages)).days
+
+
+def _study_slot(name, tracker, limit):
+    """A slot reading the tracker's next chunk, or None if nothing is left."""
+    chunk = tracker.next_chunk(limit)
+    if not chunk or not chunk.pieces:
+        return None
+    return {
+        "name": name,
+        "subject": tracker.name,
+        "task": chunk.text(),
+        "minutes": chunk.minutes,
+        "segments": chunk.segments(),
+    }
+
+
+def _run_schedule(start_date, resume_pages, syllabus=None):
+    """One generation run on the tracker engine. `syllabus` (default: the
+    module's subjects_data) maps subject -> chapter list; day checkpoints are
+    only used and recorded for the module's own syllabus."""
+    use_checkpoints = syllabus is None
+    syllabus = subjects_data if syllabus is None else syllabus
+
+    # Define slot pipelines: each slot has an ordered list of subjects
+    slot1_pipeline, slot2_pipeline = (
+        [SubjectTracker(name, syllabus[name], start_from_page=resume_pages.get(name)) for name in pipeline]
+        for pipeline in PIPELINES
+    )
+    trackers = slot1_pipeline + slot2_pipeline
+
     # Active subjects — start with the first in each pipeline
     active_slot1 = slot1_pipeline.pop(0)
     active_slot2 = slot2_pipeline.pop(0)
 
     schedule = []
+    states = []
     current_date = start_date
 
     while True:
@@ -240,6 +416,24 @@ def generate_schedule(start_date=None, resume_pages=None):
         if not s1_active and not s2_active:
             break
 
+        # Which subject is active follows from the trackers (a successor only
+        # takes over once its predecessor is finished), so their positions
+        # plus the weekday fix every day from here on
+        state = (current_date.weekday(), tuple(
+            (t.current_chapter_idx, t.current_page, t.finished) for t in trackers
+        ))
+        checkpoint = _find_checkpoint(state) if use_checkpoints else None
+        if checkpoint is not None:
+            run, i = checkpoint
+            offset = current_date - datetime.date.fromisoformat(run.days[i]["date"])
+            schedule.extend(_shift_days(run.days[i:], offset))
+            states.extend(run.states[i:])
+            with _checkpoints_lock:
+                _checkpoint_stats["hits"] += 1
+                _checkpoint_stats["days_reused"] += len(run.days) - i
+            break
+        states.append(state)
+
         day_name = current_date.strftime("%A")
         is_weekend = day_name in ["Saturday", "Sunday"]
 
@@ -255,17 +449,17 @@ def generate_schedule(start_date=None, resume_pages=None):
 
             # Slot 1 (Morning)
             if active_slot1 and not active_slot1.finished:
-                morning_hardness = active_slot1.chapters[active_slot1.current_chapter_idx].get('hardness', 1.0)
+                morning_hardness = active_slot1.current_hardness()
                 base_cap = LIMITS["Morning_Default"]
 
                 other_h_val = None
                 if active_slot2 and not active_slot2.finished:
-                    other_h_val = active_slot2.chapters[active_slot2.current_chapter_idx].get('hardness', 1.0)
+                    other_h_val = active_slot2.current_hardness()
 
                 limit = calculate_limit(active_slot1, "Morning", other_hardness_value=other_h_val, base_cap_override=base_cap)
-                task = active_slot1.get_next_chunk(limit)
-                if task:
-                    day_plan["slots"].append({"name": "Morning", "subject": active_slot1.name, "task": task, "minutes": active_slot1.last_chunk_minutes})
+                slot = _study_slot("Morning", active_slot1, limit)
+                if slot:
+                    day_plan["slots"].append(slot)
                 else:
                     day_plan["slots"].append({"name": "Morning", "subject": "Revision", "task": "Subject Revision"})
                     morning_hardness = 0.0
@@ -276,9 +470,9 @@ def generate_schedule(start_date=None, resume_pages=None):
             # Slot 2 (Evening)
             if active_slot2 and not active_slot2.finished:
                 limit = calculate_limit(active_slot2, "Evening", other_hardness_value=morning_hardness)
-                task = active_slot2.get_next_chunk(limit)
-                if task:
-                    day_plan["slots"].append({"name": "Evening", "subject": active_slot2.name, "task": task, "minutes": active_slot2.last_chunk_minutes})
+                slot = _study_slot("Evening", active_slot2, limit)
+                if slot:
+                    day_plan["slots"].append(slot)
                 else:
                     day_plan["slots"].append({"name": "Evening", "subject": "Revision", "task": "Subject Revision"})
             else:
@@ -291,34 +485,77 @@ def generate_schedule(start_date=None, resume_pages=None):
             if active_slot1 and not active_slot1.finished:
                 base_cap = LIMITS["Weekend_Default"]
                 limit = calculate_limit(active_slot1, "WeekendBlock", base_cap_override=base_cap)
-                task = active_slot1.get_next_chunk(limit)
-                if task:
-                    day_plan["slots"].append({"name": "Block 1", "subject": active_slot1.name, "task": task, "minutes": active_slot1.last_chunk_minutes})
+                slot = _study_slot("Block 1", active_slot1, limit)
+                if slot:
+                    day_plan["slots"].append(slot)
             else:
                 day_plan["slots"].append({"name": "Block 1", "subject": "Buffer", "task": "Revision"})
 
             # Block 2 — Slot 1 subject (continued)
             if active_slot1 and not active_slot1.finished:
                 limit = calculate_limit(active_slot1, "WeekendBlock", base_cap_override=LIMITS["Weekend_Default"])
-                task = active_slot1.get_next_chunk(limit)
-                if task:
-                    day_plan["slots"].append({"name": "Block 2", "subject": active_slot1.name, "task": task, "minutes": active_slot1.last_chunk_minutes})
+                slot = _study_slot("Block 2", active_slot1, limit)
+                if slot:
+                    day_plan["slots"].append(slot)
             else:
                 day_plan["slots"].append({"name": "Block 2", "subject": "Buffer", "task": "Revision"})
 
             # Block 3 — Slot 2 subject
             if active_slot2 and not active_slot2.finished:
                 limit = calculate_limit(active_slot2, "WeekendBlock", base_cap_override=LIMITS["Weekend_Default"])
-                task = active_slot2.get_next_chunk(limit)
-                if task:
-                    day_plan["slots"].append({"name": "Block 3", "subject": active_slot2.name, "task": task, "minutes": active_slot2.last_chunk_minutes})
+                slot = _study_slot("Block 3", active_slot2, limit)
+                if slot:
+                    day_plan["slots"].append(slot)
             else:
                 day_plan["slots"].append({"name": "Block 3", "subject": "Buffer", "task": "Revision"})
 
         schedule.append(day_plan)
         current_date += datetime.timedelta(days=1)
 
-    return schedule
+    run = _PlanRun(schedule, states)
+    if use_checkpoints:
+        _remember_checkpoints(run)
+    return run
+
+def _run_schedule_numpy(start_date, resume_pages):
+    import scheduler_numpy
+    return _PlanRun(scheduler_numpy.generate(start_date, resume_pages), [])
+
+
+_ENGINES = {"python": _run_schedule, "numpy": _run_schedule_numpy}
+if SCHEDULE_ENGINE not in _ENGINES:
+    print(f"Unknown SCHEDULE_ENGINE {SCHEDULE_ENGINE!r}, using the python engine")
+    SCHEDULE_ENGINE = "python"
+elif SCHEDULE_ENGINE == "numpy" and importlib.util.find_spec("numpy") is None:
+    print("SCHEDULE_ENGINE=numpy but numpy is not installed, using the python engine")
+    SCHEDULE_ENGINE = "python"
+
+def schedule_fingerprint(start_date, resume_pages):
+    """Stable hash of everything generate_schedule's output depends on."""
+    payload = json.dumps({
+        "version": SCHEDULE_VERSION,
+        "subjects": subjects_data,
+        "limits": LIMITS,
+        "start": start_date.isoformat(),
+        "resume": resume_pages,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_or_generate_schedule(user_id=DEFAULT_USER):
+    """A user's current plan, from their persisted snapshot when its
+    fingerprint still matches their configuration; otherwise generated and
+    snapshotted.
+
+    Returns (schedule, source) with source "snapshot" or "generated"."""
+    start_date, resume_pages = _resolve_config(None, None, user_id)
+    fingerprint = schedule_fingerprint(start_date, resume_pages)
+    snapshot = load_schedule_snapshot(fingerprint, user_id)
+    if snapshot is not None:
+        return snapshot, "snapshot"
+    schedule = generate_schedule(start_date=start_date, resume_pages=resume_pages)
+    save_schedule_snapshot(fingerprint, schedule, user_id)
+    return schedule, "generated"
 
 if __name__ == "__main__":
     import json
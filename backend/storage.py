@@ -1,7 +1,15 @@
 import sqlite3
+import bisect
+import itertools
 import json
 import os
+import queue
+import re
 import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
 # Check for DATABASE_URL environment variable (provided by Render/Neon)
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -11,6 +19,48 @@ DB_PATH = os.environ.get('DATABASE_PATH', '/opt/render/project/data/progress.db'
 if not os.path.exists(os.path.dirname(DB_PATH)):
     DB_PATH = "progress.db"
 
+# Postgres pool sizing. The pool is bounded: a request that finds every
+# connection busy waits up to DB_POOL_TIMEOUT seconds for one to come back.
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '5'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+# An idle Postgres connection older than this (seconds) is pinged before reuse
+# — Neon drops idle connections, and a dead one would fail the next query.
+DB_HEALTH_CHECK_AFTER = float(os.environ.get('DB_HEALTH_CHECK_AFTER', '30'))
+# Per-connection prepared-statement cache size for SQLite
+SQLITE_STATEMENT_CACHE = 128
+
+# Group commit: when enabled, set_* writes are queued for a single writer
+# thread that merges them and commits each batch in one transaction.
+#   GROUP_COMMIT_INTERVAL_MS  how long the writer gathers writes per batch
+#   GROUP_COMMIT_MAX_QUEUE    queue depth; a full queue makes writers wait for room
+#   GROUP_COMMIT_ACK          "durable" = a write returns once committed,
+#                             "queued"  = once enqueued (faster, may lose the
+#                                         last interval's writes on a crash)
+GROUP_COMMIT = os.environ.get('GROUP_COMMIT', '').lower() in ('1', 'true', 'yes')
+GROUP_COMMIT_INTERVAL_MS = float(os.environ.get('GROUP_COMMIT_INTERVAL_MS', '50'))
+GROUP_COMMIT_MAX_QUEUE = int(os.environ.get('GROUP_COMMIT_MAX_QUEUE', '1000'))
+GROUP_COMMIT_ACK = os.environ.get('GROUP_COMMIT_ACK', 'durable').lower()
+
+# Planner state is namespaced per user. DEFAULT_USER owns every row written
+# before namespacing and is used when a request names no user. The table
+# caches of at most USER_CACHE_SIZE users are kept in memory; the least
+# recently used are dropped and re-read on their next request.
+DEFAULT_USER = "default"
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '256'))
+
+# Change log for /api/sync: every synced write stamps its row with a new
+# version. The log holds one entry per key; delete tombstones older than
+# CHANGE_LOG_TOMBSTONE_VERSIONS versions are compacted away, and a client
+# whose cursor predates them is told to reload in full.
+CHANGE_LOG_TOMBSTONE_VERSIONS = int(os.environ.get('CHANGE_LOG_TOMBSTONE_VERSIONS', '10000'))
+# Compact tombstones once every this many versions
+CHANGE_LOG_COMPACT_EVERY = 500
+
+# Preferences are cached in memory and kept coherent by set_preference(). When
+# several processes share one database, set this (seconds) so each process
+# re-reads the table periodically and picks up the others' writes. 0 = never.
+PREFERENCE_CACHE_TTL = float(os.environ.get('PREFERENCE_CACHE_TTL', '0'))
+
 def get_db_connection():
     """Get database connection based on configuration"""
     if DATABASE_URL:
@@ -19,7 +69,7 @@ def get_db_connection():
         except ImportError:
             print("ERROR: psycopg2 not installed! Install with: pip install psycopg2-binary")
             print("Falling back to SQLite (data will not persist on Render!)")
-            conn = sqlite3.connect(DB_PATH)
+            conn = sqlite3.connect(DB_PATH, cached_statements=SQLITE_STATEMENT_CACHE)
             return conn, "sqlite"
 
         try:
@@ -29,78 +79,303 @@ def get_db_connection():
         except Exception as e:
             print(f"Failed to connect to PostgreSQL: {e}")
             print("Falling back to SQLite (data will not persist on Render!)")
-            conn = sqlite3.connect(DB_PATH)
+            conn = sqlite3.connect(DB_PATH, cached_statements=SQLITE_STATEMENT_CACHE)
             return conn, "sqlite"
     else:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(DB_PATH, cached_statements=SQLITE_STATEMENT_CACHE)
         return conn, "sqlite"
 
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within DB_POOL_TIMEOUT."""
+
+
+class _ConnectionPool:
+    """Bounded pool of long-lived connections.
+
+    Postgres connections are shared across threads through a LIFO idle list
+    (most recently used first, so the rest can age out). SQLite connections
+    are not safe to share, so each thread keeps one of its own for its whole
+    lifetime. Either way a storage call borrows a warm connection instead of
+    paying a connect (a TLS handshake against Neon) per statement.
+    """
+
+    def __init__(self, maxconn, timeout):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._idle = []  # [(conn, db_type, last_used)]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "connects": 0,
+            "health_checks": 0,
+            "discarded": 0,
+            "waits": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "timeouts": 0,
+            "sqlite_threads": 0,
+        }
+
+    # -- SQLite: one connection per thread ---------------------------------
+
+    def _sqlite(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(DB_PATH, cached_statements=SQLITE_STATEMENT_CACHE)
+            self._local.conn = conn
+            with self._lock:
+                self._stats["connects"] += 1
+                self._stats["sqlite_threads"] += 1
+        with self._lock:
+            self._stats["checkouts"] += 1
+        return conn
+
+    # -- Postgres: bounded shared pool -------------------------------------
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < DB_HEALTH_CHECK_AFTER:
+            return True
+        with self._lock:
+            self._stats["health_checks"] += 1
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._stats["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Borrow a connection. Returns (conn, db_type)."""
+        if not DATABASE_URL:
+            return self._sqlite(), "sqlite"
+
+        t0 = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeout(f"no database connection free after {self.timeout}s")
+        waited_ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            if waited_ms >= 1:
+                self._stats["waits"] += 1
+                self._stats["wait_ms_total"] += waited_ms
+                self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], waited_ms)
+
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    break
+                conn, db_type, last_used = entry
+                if self._healthy(conn, last_used):
+                    return conn, db_type
+                self._discard(conn)
+
+            conn, db_type = get_db_connection()
+            with self._lock:
+                self._stats["connects"] += 1
+            if db_type != "postgres":
+                # Postgres is unreachable: serve this call from SQLite and let
+                # the next one retry, exactly as an unpooled connect would.
+                self._return_slot()
+                conn.close()
+                return self._sqlite(), "sqlite"
+            return conn, db_type
+        except BaseException:
+            self._return_slot()
+            raise
+
+    def _return_slot(self):
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    def release(self, conn, db_type, broken=False):
+        if db_type != "postgres":
+            return
+        try:
+            if not (broken or conn.closed or self._closed):
+                # End the implicit transaction a read opened, so the
+                # connection never sits "idle in transaction" in the pool
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            if broken or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, db_type, time.monotonic()))
+        finally:
+            self._return_slot()
+
+    def close(self):
+        """Close every idle connection (called at process exit)."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            idle = len(self._idle)
+            in_use = self._in_use
+        out.update({
+            "backend": "postgres" if DATABASE_URL else "sqlite",
+            "max_size": self.maxconn,
+            "in_use": in_use,
+            "idle": idle,
+            "size": in_use + idle,
+            "wait_ms_avg": round(out["wait_ms_total"] / out["waits"], 2) if out["waits"] else 0.0,
+        })
+        out["wait_ms_total"] = round(out["wait_ms_total"], 2)
+        out["wait_ms_max"] = round(out["wait_ms_max"], 2)
+        return out
+
+
+_pool = _ConnectionPool(DB_POOL_MAX, DB_POOL_TIMEOUT)
+
+
+@contextmanager
+def _connection():
+    """Borrow a pooled connection for one unit of work.
+
+    Yields (conn, db_type). The caller commits; anything left uncommitted when
+    the block raises is rolled back before the connection goes back to the pool.
+    """
+    conn, db_type = _pool.acquire()
+    broken = False
+    try:
+        yield conn, db_type
+    except BaseException:
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        raise
+    finally:
+        _pool.release(conn, db_type, broken=broken)
+
+
+def pool_stats():
+    """Connection pool size, checkout and wait-time metrics."""
+    return _pool.stats()
+
+
+def close_pool():
+    """Drain the group-commit queue, then close pooled connections."""
+    if _writer is not None:
+        _writer.stop()
+    _pool.close()
+
+# Per-user tables and their columns besides user_id. Each is keyed by
+# (user_id, key); rows written before namespacing belong to DEFAULT_USER.
+_USER_TABLES = {
+    # Completion flag per "date_slot" (or habit) key
+    "progress": "date VARCHAR(10), slot VARCHAR(64), completed INTEGER NOT NULL",
+    "preferences": "value TEXT",
+    # Pomodoro seconds per "date_slot" key
+    "study_time": "date VARCHAR(10), slot VARCHAR(64), seconds INTEGER NOT NULL",
+    # Last page reached per "date_slot" key
+    "task_pages": "date VARCHAR(10), slot VARCHAR(64), page INTEGER NOT NULL",
+    # Spaced-repetition done flag per revision key
+    "revisions": "done INTEGER NOT NULL",
+    # SM-2 review state JSON per chapter slug, plus its hot fields as typed
+    # columns so the due queue is an index range scan
+    "reviews": "state TEXT NOT NULL, due VARCHAR(10), interval_days INTEGER, ease REAL, reps INTEGER",
+    # weak|medium|strong per chapter slug
+    "confidence": "level TEXT NOT NULL",
+}
+
+def _user_table_ddl(table, columns):
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            user_id VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_USER}',
+            key VARCHAR(255) NOT NULL,
+            {columns},
+            PRIMARY KEY (user_id, key)
+        )
+    '''
+
 def init_db():
     """Initialize the database and create tables if they don't exist"""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
+        with _connection() as (conn, db_type):
+            cursor = conn.cursor()
 
-        print(f"Initializing database (type: {db_type})...")
+            print(f"Initializing database (type: {db_type})...")
 
-        # Create progress table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS progress (
-                key VARCHAR(255) PRIMARY KEY,
-                completed INTEGER NOT NULL
-            )
-        ''')
+            # Per-user tables: every row belongs to a user_id namespace
+            for table, columns in _USER_TABLES.items():
+                cursor.execute(_user_table_ddl(table, columns))
 
-        # Create preferences table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS preferences (
-                key VARCHAR(255) PRIMARY KEY,
-                value TEXT
-            )
-        ''')
+            # Create schedule_snapshot table (latest generated plan JSON per user,
+            # tagged with the config fingerprint it was generated from)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schedule_snapshot (
+                    user_id VARCHAR(64) PRIMARY KEY,
+                    fingerprint VARCHAR(64) NOT NULL,
+                    plan TEXT NOT NULL
+                )
+            ''')
 
-        # Create study_time table (pomodoro seconds per "date_slot" key)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS study_time (
-                key VARCHAR(255) PRIMARY KEY,
-                seconds INTEGER NOT NULL
-            )
-        ''')
+            # Create change_log table (latest change version per synced row)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS change_log (
+                    user_id VARCHAR(64) NOT NULL,
+                    tbl VARCHAR(32) NOT NULL,
+                    key VARCHAR(255) NOT NULL,
+                    version BIGINT NOT NULL,
+                    deleted INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, tbl, key)
+                )
+            ''')
 
-        # Create task_pages table (last page reached per "date_slot" key)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS task_pages (
-                key VARCHAR(255) PRIMARY KEY,
-                page INTEGER NOT NULL
-            )
-        ''')
+            # Create change_clock table (single row: last version handed out,
+            # and the version below which tombstones have been compacted)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS change_clock (
+                    id INTEGER PRIMARY KEY,
+                    version BIGINT NOT NULL,
+                    horizon BIGINT NOT NULL
+                )
+            ''')
 
-        # Create revisions table (spaced-repetition done flag per revision key)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS revisions (
-                key VARCHAR(255) PRIMARY KEY,
-                done INTEGER NOT NULL
-            )
-        ''')
+            # Create schema_migrations table (one row per applied migration)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY
+                )
+            ''')
 
-        # Create reviews table (SM-2 review state JSON per chapter slug)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reviews (
-                key VARCHAR(255) PRIMARY KEY,
-                state TEXT NOT NULL
-            )
-        ''')
+            conn.commit()
 
-        # Create confidence table (weak|medium|strong per chapter slug)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS confidence (
-                key VARCHAR(255) PRIMARY KEY,
-                level TEXT NOT NULL
-            )
-        ''')
-
-        conn.commit()
-        conn.close()
+            _run_migrations(conn, db_type)
 
         print(f"Database initialized successfully (type: {db_type})")
 
@@ -113,6 +388,170 @@ def init_db():
         import traceback
         traceback.print_exc()
 
+_DATE_SLOT_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})_(.+)$')
+_ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
+def _split_key(key):
+    """"2026-07-20_Morning" -> ("2026-07-20", "Morning"); keys that aren't
+    date-prefixed (habit marks, etc.) -> (None, None)."""
+    m = _DATE_SLOT_RE.match(key)
+    return (m.group(1), m.group(2)) if m else (None, None)
+
+def _column_names(cursor, db_type, table):
+    if db_type == "postgres":
+        cursor.execute(
+            'SELECT column_name FROM information_schema.columns WHERE table_name = %s', (table,)
+        )
+        return {row[0] for row in cursor.fetchall()}
+    cursor.execute(f'PRAGMA table_info({table})')
+    return {row[1] for row in cursor.fetchall()}
+
+# Tables keyed by "date_slot" that also carry the parsed date and slot columns
+_DATE_SLOT_TABLES = ("progress", "study_time", "task_pages")
+
+def _migrate_date_slot_columns(cursor, db_type):
+    """Split "date_slot" keys into indexed date/slot columns."""
+    ph = "%s" if db_type == "postgres" else "?"
+    for table in _DATE_SLOT_TABLES:
+        columns = _column_names(cursor, db_type, table)
+        if "date" not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN date VARCHAR(10)')
+        if "slot" not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN slot VARCHAR(64)')
+        cursor.execute(f'SELECT key FROM {table} WHERE date IS NULL')
+        rows = []
+        for (key,) in cursor.fetchall():
+            date, slot = _split_key(key)
+            if date:
+                rows.append((date, slot, key))
+        if rows:
+            cursor.executemany(f'UPDATE {table} SET date = {ph}, slot = {ph} WHERE key = {ph}', rows)
+            print(f"Backfilled date/slot for {len(rows)} {table} rows")
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_date_slot ON {table} (date, slot)')
+
+def _migrate_user_namespaces(cursor, db_type):
+    """Key every table by (user_id, key); existing rows go to DEFAULT_USER."""
+    for table, columns in _USER_TABLES.items():
+        existing = _column_names(cursor, db_type, table)
+        if "user_id" in existing:
+            continue
+        if db_type == "postgres":
+            cursor.execute(
+                f"ALTER TABLE {table} ADD COLUMN user_id VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_USER}'"
+            )
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {table}_pkey')
+            cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (user_id, key)')
+        else:
+            # SQLite can't change a primary key in place — rebuild the table
+            copied = ", ".join(sorted(existing))
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_unscoped')
+            cursor.execute(_user_table_ddl(table, columns))
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, {copied}) SELECT '{DEFAULT_USER}', {copied} FROM {table}_unscoped"
+            )
+            cursor.execute(f'DROP TABLE {table}_unscoped')
+        print(f"Scoped {table} rows to user '{DEFAULT_USER}'")
+    for table in _DATE_SLOT_TABLES:
+        cursor.execute(f'DROP INDEX IF EXISTS idx_{table}_date_slot')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user_date_slot ON {table} (user_id, date, slot)')
+    # Snapshots are derived data: start over with one row per user
+    cursor.execute('DROP TABLE schedule_snapshot')
+    cursor.execute('''
+        CREATE TABLE schedule_snapshot (
+            user_id VARCHAR(64) PRIMARY KEY,
+            fingerprint VARCHAR(64) NOT NULL,
+            plan TEXT NOT NULL
+        )
+    ''')
+
+# Tables whose writes are recorded in change_log, with each one's value
+# column and its decoder
+_SYNC_TABLES = {
+    "progress": ("completed", bool),
+    "study_time": ("seconds", int),
+    "task_pages": ("page", int),
+    "revisions": ("done", bool),
+    "reviews": ("state", json.loads),
+    "confidence": ("level", str),
+}
+
+def _migrate_change_log(cursor, db_type):
+    """Start the change clock and log every existing synced row at version 1."""
+    cursor.execute('DELETE FROM change_clock')
+    cursor.execute('INSERT INTO change_clock (id, version, horizon) VALUES (1, 1, 0)')
+    for table in _SYNC_TABLES:
+        cursor.execute(
+            f"INSERT INTO change_log (user_id, tbl, key, version, deleted) "
+            f"SELECT user_id, '{table}', key, 1, 0 FROM {table}"
+        )
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_version ON change_log (user_id, tbl, version)')
+
+def _review_columns(state):
+    """(due, interval, ease, reps) typed columns for a review state dict; a
+    missing or malformed field is None (a row without a due date never
+    shows up in the due queue)."""
+    if not isinstance(state, dict):
+        return None, None, None, None
+    due = state.get("due")
+    if not (isinstance(due, str) and _ISO_DATE_RE.match(due)):
+        due = None
+    else:
+        due = due[:10]
+    values = []
+    for field, kind in (("interval", int), ("ease", float), ("reps", int)):
+        value = state.get(field)
+        try:
+            values.append(kind(value) if value is not None and not isinstance(value, bool) else None)
+        except (TypeError, ValueError):
+            values.append(None)
+    return (due, *values)
+
+def _migrate_review_columns(cursor, db_type):
+    """Copy due/interval/ease/reps out of each review's JSON state into typed,
+    indexed columns."""
+    ph = "%s" if db_type == "postgres" else "?"
+    columns = _column_names(cursor, db_type, "reviews")
+    for column, kind in (("due", "VARCHAR(10)"), ("interval_days", "INTEGER"),
+                         ("ease", "REAL"), ("reps", "INTEGER")):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE reviews ADD COLUMN {column} {kind}')
+    cursor.execute('SELECT user_id, key, state FROM reviews')
+    rows = []
+    for user_id, key, state in cursor.fetchall():
+        try:
+            state = json.loads(state)
+        except (json.JSONDecodeError, TypeError):
+            continue
+        rows.append((*_review_columns(state), user_id, key))
+    if rows:
+        cursor.executemany(
+            f'UPDATE reviews SET due = {ph}, interval_days = {ph}, ease = {ph}, reps = {ph} '
+            f'WHERE user_id = {ph} AND key = {ph}', rows
+        )
+        print(f"Backfilled review columns for {len(rows)} reviews rows")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reviews_user_due ON reviews (user_id, due)')
+
+# Ordered schema migrations, each applied once and recorded in schema_migrations
+_MIGRATIONS = [
+    (1, _migrate_date_slot_columns),
+    (2, _migrate_user_namespaces),
+    (3, _migrate_change_log),
+    (4, _migrate_review_columns),
+]
+
+def _run_migrations(conn, db_type):
+    ph = "%s" if db_type == "postgres" else "?"
+    cursor = conn.cursor()
+    cursor.execute('SELECT version FROM schema_migrations')
+    applied = {row[0] for row in cursor.fetchall()}
+    for version, migrate in _MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"Applying schema migration {version} ({migrate.__name__})...")
+        migrate(cursor, db_type)
+        cursor.execute(f'INSERT INTO schema_migrations (version) VALUES ({ph})', (version,))
+        conn.commit()
+
 def migrate_from_json():
     """Migrate data from old progress.json file if it exists"""
     old_file = "progress.json"
@@ -121,308 +560,1268 @@ def migrate_from_json():
             with open(old_file, "r") as f:
                 old_data = json.load(f)
             
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM progress')
-            count = cursor.fetchone()[0]
-            
-            if count == 0 and old_data:
-                print(f"Migrating {len(old_data)} entries from progress.json to database...")
-                for key, completed in old_data.items():
-                    cursor.execute(
-                        'INSERT OR REPLACE INTO progress (key, completed) VALUES (?, ?)',
-                        (key, 1 if completed else 0)
-                    )
-                conn.commit()
-                print("Migration completed successfully!")
-            
-            conn.close()
+            with _connection() as (conn, db_type):
+                if db_type != "sqlite":
+                    return
+                cursor = conn.cursor()
+                cursor.execute('SELECT COUNT(*) FROM progress')
+                count = cursor.fetchone()[0]
+
+                if count == 0 and old_data:
+                    print(f"Migrating {len(old_data)} entries from progress.json to database...")
+                    _write_rows(cursor, db_type, [
+                        (DEFAULT_USER, "progress", "set", key, completed)
+                        for key, completed in old_data.items()
+                    ])
+                    conn.commit()
+                    print("Migration completed successfully!")
         except (json.JSONDecodeError, Exception) as e:
             print(f"Migration from progress.json failed: {e}")
 
-def load_progress():
-    """Load all progress data from database"""
+# Source of ProgressMap and _TableCache versions, shared so versions are unique
+# process-wide — a map or cache rebuilt after eviction never repeats one
+_VERSION_CLOCK = itertools.count(1)
+
+class ProgressMap(dict):
+    """The in-memory completion map: a dict with dirty-key tracking and two
+    secondary indexes.
+
+    Every assignment or deletion records the key, so save_progress() can write
+    just the rows that changed since the last save instead of the whole table.
+    Keys are also kept in a sorted list, so prefix and range lookups bisect to
+    the first match and cost O(log n + k) instead of a scan over every key,
+    and date-shaped keys are indexed by date -> {slot: completed}, so a
+    (date, slot) probe needs no key string built. `version` moves on every
+    change (read it before reading the map; see _TableCache).
+
+    One listener (see set_listener) can follow completion flips of
+    "date_slot" keys, to keep state derived from the map current in O(1).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._keys = sorted(dict.keys(self))
+        self._by_date = {}
+        for key, value in dict.items(self):
+            self._index_day(key, value)
+        self.version = next(_VERSION_CLOCK)
+        self._listener = None
+
+    def _index_day(self, key, value):
+        date, slot = _split_key(key)
+        if date:
+            self._by_date.setdefault(date, {})[slot] = value
+
+    def _unindex_day(self, key):
+        date, slot = _split_key(key)
+        if date and date in self._by_date:
+            self._by_date[date].pop(slot, None)
+            if not self._by_date[date]:
+                del self._by_date[date]
+
+    def _notify(self, key, was, now):
+        if self._listener is not None and bool(was) != bool(now):
+            date, slot = _split_key(key)
+            if date:
+                self._listener.progress_changed(date, slot, bool(now))
+
+    def _set(self, key, value):
+        was = dict.get(self, key, False)
+        if key not in self:
+            bisect.insort(self._keys, key)
+        super().__setitem__(key, value)
+        self._index_day(key, value)
+        self.version = next(_VERSION_CLOCK)
+        self._notify(key, was, value)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._set(key, value)
+            self._dirty.add(key)
+
+    def __delitem__(self, key):
+        with self._lock:
+            was = dict.__getitem__(self, key)
+            super().__delitem__(key)
+            del self._keys[bisect.bisect_left(self._keys, key)]
+            self._unindex_day(key)
+            self._dirty.add(key)
+            self.version = next(_VERSION_CLOCK)
+            self._notify(key, was, False)
+
+    def pop(self, key, *default):
+        with self._lock:
+            if key in self:
+                value = self[key]
+                del self[key]
+                return value
+            return super().pop(key, *default)
+
+    def popitem(self):
+        with self._lock:
+            key = next(reversed(dict.keys(self)))
+            return key, self.pop(key)
+
+    def clear(self):
+        with self._lock:
+            cleared = list(dict.items(self))
+            self._dirty.update(dict.keys(self))
+            super().clear()
+            self._keys = []
+            self._by_date = {}
+            self.version = next(_VERSION_CLOCK)
+            for key, was in cleared:
+                self._notify(key, was, False)
+
+    def setdefault(self, key, default=None):
+        with self._lock:
+            if key not in self:
+                self[key] = default
+            return self[key]
+
+    def update(self, *args, **kwargs):
+        with self._lock:
+            for key, value in dict(*args, **kwargs).items():
+                self[key] = value
+
+    def set_saved(self, key, value):
+        """Set a value that is already persisted (no dirty mark)."""
+        with self._lock:
+            self._set(key, value)
+
+    def set_listener(self, make_listener):
+        """Replace the change listener with make_listener(self) and return it.
+
+        The listener's progress_changed(date, slot, completed) is called
+        whenever a "date_slot" key's completion flips. make_listener runs
+        under the map's lock, so a listener that reads the map to initialise
+        itself can't miss a change made meanwhile. Callbacks also run under
+        the lock — keep them O(1)."""
+        with self._lock:
+            self._listener = make_listener(self)
+            return self._listener
+
+    def take_dirty(self):
+        """Swap out and return the set of keys changed since the last call."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def mark_dirty(self, keys):
+        """Put keys back after a failed save so the next one retries them."""
+        with self._lock:
+            self._dirty.update(keys)
+
+    @property
+    def dirty(self):
+        with self._lock:
+            return frozenset(self._dirty)
+
+    # -- Indexed lookups ---------------------------------------------------
+
+    def is_completed(self, date, slot):
+        """Completion of the (date, slot) key — O(1), no string building."""
+        return self._by_date.get(date, {}).get(slot, False)
+
+    def day(self, date):
+        """{slot: completed} for one date (read-only view)."""
+        return self._by_date.get(date, {})
+
+    def prefix_items(self, prefix):
+        """{key: completed} for keys starting with `prefix`."""
+        with self._lock:
+            keys = self._keys
+            out = {}
+            i = bisect.bisect_left(keys, prefix)
+            while i < len(keys) and keys[i].startswith(prefix):
+                out[keys[i]] = dict.__getitem__(self, keys[i])
+                i += 1
+            return out
+
+    def range_items(self, lo=None, hi=None):
+        """{key: completed} for keys with lo <= key <= hi (either bound open)."""
+        with self._lock:
+            keys = self._keys
+            i = bisect.bisect_left(keys, lo) if lo is not None else 0
+            j = bisect.bisect_right(keys, hi) if hi is not None else len(keys)
+            return {key: dict.__getitem__(self, key) for key in keys[i:j]}
+
+    def date_range_items(self, from_date=None, to_date=None):
+        """{key: completed} for "date_slot" keys dated within [from_date, to_date]."""
+        # Every "date_slot" key sorts between its bare date and date + "_\uffff"
+        lo = from_date if from_date is not None else "0000-00-00"
+        hi = (to_date if to_date is not None else "9999-12-31") + "_\uffff"
+        return {k: v for k, v in self.range_items(lo, hi).items() if _DATE_SLOT_RE.match(k)}
+
+
+# Write statements keyed by (table, mode): "set" overwrites, "max" keeps the
+# larger of the stored and incoming value (monotonic). Shared by the single-row
+# set_* functions and apply_batch(), so each statement text is built once and
+# hits the per-connection statement cache.
+_WRITE_SQL = {
+    ("progress", "set"): {
+        "postgres": '''
+            INSERT INTO progress (user_id, key, date, slot, completed) VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE SET completed = EXCLUDED.completed
+        ''',
+        "sqlite": 'INSERT OR REPLACE INTO progress (user_id, key, date, slot, completed) VALUES (?, ?, ?, ?, ?)',
+    },
+    ("progress", "delete"): {
+        "postgres": 'DELETE FROM progress WHERE user_id = %s AND key = %s',
+        "sqlite": 'DELETE FROM progress WHERE user_id = ? AND key = ?',
+    },
+    ("study_time", "max"): {
+        "postgres": '''
+            INSERT INTO study_time (user_id, key, date, slot, seconds) VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE
+            SET seconds = GREATEST(study_time.seconds, EXCLUDED.seconds)
+        ''',
+        "sqlite": '''
+            INSERT INTO study_time (user_id, key, date, slot, seconds) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, key) DO UPDATE
+            SET seconds = MAX(seconds, excluded.seconds)
+        ''',
+    },
+    ("task_pages", "max"): {
+        "postgres": '''
+            INSERT INTO task_pages (user_id, key, date, slot, page) VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE
+            SET page = GREATEST(task_pages.page, EXCLUDED.page)
+        ''',
+        "sqlite": '''
+            INSERT INTO task_pages (user_id, key, date, slot, page) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, key) DO UPDATE
+            SET page = MAX(page, excluded.page)
+        ''',
+    },
+    ("task_pages", "set"): {
+        "postgres": '''
+            INSERT INTO task_pages (user_id, key, date, slot, page) VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE SET page = EXCLUDED.page
+        ''',
+        "sqlite": 'INSERT OR REPLACE INTO task_pages (user_id, key, date, slot, page) VALUES (?, ?, ?, ?, ?)',
+    },
+    ("revisions", "set"): {
+        "postgres": '''
+            INSERT INTO revisions (user_id, key, done) VALUES (%s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE SET done = EXCLUDED.done
+        ''',
+        "sqlite": 'INSERT OR REPLACE INTO revisions (user_id, key, done) VALUES (?, ?, ?)',
+    },
+    ("reviews", "set"): {
+        "postgres": '''
+            INSERT INTO reviews (user_id, key, state, due, interval_days, ease, reps)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE
+            SET state = EXCLUDED.state, due = EXCLUDED.due, interval_days = EXCLUDED.interval_days,
+                ease = EXCLUDED.ease, reps = EXCLUDED.reps
+        ''',
+        "sqlite": '''
+            INSERT OR REPLACE INTO reviews (user_id, key, state, due, interval_days, ease, reps)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''',
+    },
+    ("preferences", "set"): {
+        "postgres": '''
+            INSERT INTO preferences (user_id, key, value) VALUES (%s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE SET value = EXCLUDED.value
+        ''',
+        "sqlite": 'INSERT OR REPLACE INTO preferences (user_id, key, value) VALUES (?, ?, ?)',
+    },
+    ("confidence", "set"): {
+        "postgres": '''
+            INSERT INTO confidence (user_id, key, level) VALUES (%s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE SET level = EXCLUDED.level
+        ''',
+        "sqlite": 'INSERT OR REPLACE INTO confidence (user_id, key, level) VALUES (?, ?, ?)',
+    },
+}
+
+def _encode(table, value):
+    """Python value -> column value for a table's value column."""
+    if table in ("progress", "revisions"):
+        return 1 if value else 0
+    if table == "reviews":
+        return json.dumps(value)
+    return value
+
+def _write_rows(cursor, db_type, writes):
+    """Execute (user_id, table, mode, key, value) writes in order on an open cursor.
+
+    Consecutive writes that share a statement go through one executemany, so
+    a batch costs one round trip per run of same-kind writes instead of one
+    per row, while per-key ordering (e.g. an exact page then a monotonic one)
+    is preserved."""
+    run_sql = None
+    run_args = []
+    for user_id, table, mode, key, value in writes:
+        sql = _WRITE_SQL[(table, mode)][db_type]
+        if mode == "delete":
+            args = (user_id, key)
+        elif table in _DATE_SLOT_TABLES:
+            args = (user_id, key, *_split_key(key), _encode(table, value))
+        elif table == "reviews":
+            args = (user_id, key, _encode(table, value), *_review_columns(value))
+        else:
+            args = (user_id, key, _encode(table, value))
+        if sql is not run_sql and run_args:
+            cursor.executemany(run_sql, run_args)
+            run_args = []
+        run_sql = sql
+        run_args.append(args)
+    if run_args:
+        cursor.executemany(run_sql, run_args)
+    _log_changes(cursor, db_type, writes)
+
+_LOG_SQL = {
+    "postgres": '''
+        INSERT INTO change_log (user_id, tbl, key, version, deleted) VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (user_id, tbl, key) DO UPDATE
+        SET version = EXCLUDED.version, deleted = EXCLUDED.deleted
+    ''',
+    "sqlite": 'INSERT OR REPLACE INTO change_log (user_id, tbl, key, version, deleted) VALUES (?, ?, ?, ?, ?)',
+}
+
+def _log_changes(cursor, db_type, writes):
+    """Stamp the synced rows these writes touched with the next change version.
+
+    Runs after the data writes, in their transaction. The clock row stays
+    locked until commit, so versions become visible in the order they were
+    handed out and a reader's cursor never skips a slower transaction."""
+    rows = {
+        (user_id, table, key): mode == "delete"
+        for user_id, table, mode, key, _ in writes if table in _SYNC_TABLES
+    }
+    if not rows:
+        return
+    cursor.execute('UPDATE change_clock SET version = version + 1')
+    cursor.execute('SELECT version FROM change_clock')
+    version = cursor.fetchone()[0]
+    cursor.executemany(_LOG_SQL[db_type], [
+        (user_id, table, key, version, 1 if deleted else 0)
+        for (user_id, table, key), deleted in rows.items()
+    ])
+    if version % CHANGE_LOG_COMPACT_EVERY == 0:
+        _compact_change_log(cursor, db_type, version)
+
+def _compact_change_log(cursor, db_type, version):
+    """Drop tombstones older than the retention window. Live rows need no
+    compaction — each key keeps only its latest entry."""
+    cutoff = version - CHANGE_LOG_TOMBSTONE_VERSIONS
+    if cutoff <= 0:
+        return
+    ph = "%s" if db_type == "postgres" else "?"
+    cursor.execute(f'DELETE FROM change_log WHERE deleted = 1 AND version <= {ph}', (cutoff,))
+    if cursor.rowcount:
+        cursor.execute(f'UPDATE change_clock SET horizon = {ph} WHERE horizon < {ph}', (cutoff, cutoff))
+
+def _apply_writes(writes):
+    """Apply writes in a single transaction (raises on failure)."""
+    with _connection() as (conn, db_type):
+        _write_rows(conn.cursor(), db_type, writes)
+        conn.commit()
+
+def _merge_writes(writes):
+    """Collapse writes to the same (user, table, key) into one, keeping the result
+    the sequence would have had: an overwrite replaces anything before it, a
+    monotonic write folds in with MAX (and stays an overwrite if it follows
+    one), and a write after a delete re-creates the row."""
+    merged = {}
+    for user_id, table, mode, key, value in writes:
+        row = (user_id, table, key)
+        prev = merged.get(row)
+        if prev is None or mode in ("set", "delete"):
+            merged[row] = (mode, value)
+        elif prev[0] == "delete":
+            merged[row] = ("set", value)
+        else:
+            merged[row] = (prev[0], max(prev[1], value))
+    return [(user_id, table, mode, key, value) for (user_id, table, key), (mode, value) in merged.items()]
+
+
+class _PendingWrite:
+    __slots__ = ("writes", "done", "ok")
+
+    def __init__(self, writes):
+        self.writes = writes
+        self.done = threading.Event()
+        self.ok = False
+
+
+_STOP = object()
+
+
+class _GroupCommitWriter:
+    """Single writer thread that drains queued writes and commits each
+    gathered batch in one transaction.
+
+    Concurrent heartbeats and page updates then share one commit (one fsync,
+    one SQLite write-lock acquisition) instead of each paying for their own,
+    and repeated writes to the same key within an interval collapse to one row.
+    """
+
+    def __init__(self, interval_ms, max_queue, ack):
+        self.interval = interval_ms / 1000.0
+        self.max_queue = max_queue
+        self.durable = ack != "queued"
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._enqueue_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "writes_in": 0,
+            "rows_written": 0,
+            "merged": 0,
+            "failures": 0,
+            "backpressure_waits": 0,
+            "last_batch_rows": 0,
+            "last_flush_ms": 0.0,
+            "flush_ms_total": 0.0,
+            "max_depth_seen": 0,
+        }
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, writes, on_enqueue=None):
+        """Queue writes; with durable acks, block until they are committed.
+        Raises if the commit failed (durable) or the writer has stopped.
+
+        `on_enqueue(writes)` runs under the enqueue lock, i.e. in exactly the
+        order the writer will commit — used to keep the read caches in step."""
+        if not self._thread.is_alive():
+            raise RuntimeError("group-commit writer is not running")
+        pending = _PendingWrite(writes)
+        with self._enqueue_lock:
+            # Backpressure: a full queue means the writer is behind, so wait
+            # for room. Writing around the queue instead would let older
+            # queued writes to the same keys commit over this one.
+            waited = False
+            while True:
+                try:
+                    self._queue.put(pending, timeout=self.interval * 10 + 1)
+                    break
+                except queue.Full:
+                    if not self._thread.is_alive():
+                        raise RuntimeError("group-commit writer is not running")
+                    waited = True
+            if waited:
+                with self._lock:
+                    self._stats["backpressure_waits"] += 1
+            if on_enqueue:
+                on_enqueue(writes)
+        with self._lock:
+            self._stats["max_depth_seen"] = max(self._stats["max_depth_seen"], self._queue.qsize())
+        if self.durable:
+            if not pending.done.wait(timeout=DB_POOL_TIMEOUT + self.interval * 10 + 30):
+                raise TimeoutError("group commit did not complete in time")
+            if not pending.ok:
+                raise RuntimeError("group commit failed")
+
+    def flush(self, timeout=30):
+        """Block until everything queued before this call is committed."""
+        marker = _PendingWrite([])
+        self._queue.put(marker)
+        return marker.done.wait(timeout=timeout)
+
+    def stop(self):
+        """Commit what is queued, then end the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=30)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        writes = [w for pending in batch for w in pending.writes]
+        rows = _merge_writes(writes)
+        t0 = time.perf_counter()
+        try:
+            if rows:
+                _apply_writes(rows)
+            for pending in batch:
+                pending.ok = True
+        except Exception as e:
+            print(f"Database error in group commit ({len(rows)} rows): {e}")
+            with self._lock:
+                self._stats["failures"] += 1
+            # Retry each submission on its own so one bad write can't sink
+            # the others that happened to share its batch
+            for pending in batch:
+                try:
+                    if pending.writes:
+                        _apply_writes(pending.writes)
+                    pending.ok = True
+                except Exception as e:
+                    print(f"Database error in group commit retry: {e}")
+                    # The caches already hold this write; drop them so the
+                    # next read goes back to the database
+                    _cache_invalidate(pending.writes)
+        flush_ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["writes_in"] += len(writes)
+            self._stats["rows_written"] += len(rows)
+            self._stats["merged"] += len(writes) - len(rows)
+            self._stats["last_batch_rows"] = len(rows)
+            self._stats["last_flush_ms"] = round(flush_ms, 2)
+            self._stats["flush_ms_total"] += flush_ms
+        for pending in batch:
+            pending.done.set()
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+        out.update({
+            "enabled": True,
+            "ack": "durable" if self.durable else "queued",
+            "interval_ms": self.interval * 1000,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize(),
+            "avg_flush_ms": round(out["flush_ms_total"] / out["batches"], 2) if out["batches"] else 0.0,
+        })
+        out["flush_ms_total"] = round(out["flush_ms_total"], 2)
+        return out
+
+
+_writer = (
+    _GroupCommitWriter(GROUP_COMMIT_INTERVAL_MS, GROUP_COMMIT_MAX_QUEUE, GROUP_COMMIT_ACK)
+    if GROUP_COMMIT else None
+)
+
+# Striped per-key locks for direct writes: a write holds its keys' stripes
+# from the DB write through the cache update, so two racing writes to one key
+# reach the cache in the order they committed. (With group commit the writer
+# already commits in queue order, and submit() updates the cache at enqueue.)
+_KEY_LOCKS = [threading.Lock() for _ in range(64)]
+
+def _write(writes):
+    """Route writes through the group-commit writer when it is enabled,
+    otherwise apply them in their own transaction; either way fold them into
+    the table caches. Raises on failure."""
+    if _writer is not None:
+        _writer.submit(writes, on_enqueue=_cache_apply)
+        return
+    stripes = sorted({hash((user_id, table, key)) % len(_KEY_LOCKS) for user_id, table, _, key, _ in writes})
+    for i in stripes:
+        _KEY_LOCKS[i].acquire()
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
+        _apply_writes(writes)
+        _cache_apply(writes)
+    finally:
+        for i in reversed(stripes):
+            _KEY_LOCKS[i].release()
+
+def group_commit_stats():
+    """Group-commit queue depth, batch sizes and flush timings."""
+    if _writer is None:
+        return {"enabled": False}
+    return _writer.stats()
+
+def flush_writes(timeout=30):
+    """Wait until every queued group-commit write is committed."""
+    if _writer is not None:
+        return _writer.flush(timeout)
+    return True
+
+def apply_batch(writes, user_id=DEFAULT_USER):
+    """Apply a list of (table, mode, key, value) writes for one user atomically.
+
+    Returns True once they are committed together (or queued, with
+    GROUP_COMMIT_ACK=queued); False (nothing applied) if the transaction failed."""
+    if not writes:
+        return True
+    try:
+        _write([(user_id, *write) for write in writes])
+        return True
+    except Exception as e:
+        print(f"Database error in apply_batch: {e}")
+        return False
 
-        cursor.execute('SELECT key, completed FROM progress')
-        rows = cursor.fetchall()
+def load_progress(user_id=DEFAULT_USER):
+    """Load a user's progress data from database into a ProgressMap"""
+    try:
+        with _connection() as (conn, db_type):
+            cursor = conn.cursor()
 
-        conn.close()
+            ph = "%s" if db_type == "postgres" else "?"
+            cursor.execute(f'SELECT key, completed FROM progress WHERE user_id = {ph}', (user_id,))
+            rows = cursor.fetchall()
 
-        # Convert to dictionary with boolean values
-        progress_data = {key: bool(completed) for key, completed in rows}
-        print(f"Loaded {len(progress_data)} completion records from database (type: {db_type})")
-        return progress_data
+            # Convert to dictionary with boolean values
+            progress_data = ProgressMap((key, bool(completed)) for key, completed in rows)
+            print(f"Loaded {len(progress_data)} completion records for {user_id} from database (type: {db_type})")
+            return progress_data
     except Exception as e:
         print(f"Database error in load_progress: {e}")
         import traceback
         traceback.print_exc()
-        return {}
+        return ProgressMap()
 
-def save_progress(data):
-    """Save progress data to database"""
+def set_progress(key, completed, user_id=DEFAULT_USER):
+    """Upsert one completion flag — a plain overwrite, one statement."""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
+        _write([(user_id, "progress", "set", key, completed)])
+    except Exception as e:
+        print(f"Database error in set_progress: {e}")
 
-        # Clear existing data and insert new data
-        # Note: In a real production app, we might want to UPSERT instead of DELETE ALL
-        # but for this simple app, this is fine and ensures consistency
-        cursor.execute('DELETE FROM progress')
+def save_progress(data, user_id=DEFAULT_USER):
+    """Save a user's progress data to database.
 
-        # Prepare query based on DB type
-        if db_type == "postgres":
-            placeholder = "%s"
-        else:
-            placeholder = "?"
+    A ProgressMap (what load_progress returns) is saved incrementally: only
+    the keys changed since its last save are upserted or deleted, so the cost
+    of a save follows the edit, not the size of the history. Any other
+    mapping is treated as the complete new contents and replaces the user's
+    rows in a single transaction."""
+    if isinstance(data, ProgressMap):
+        keys = data.take_dirty()
+        if not keys:
+            return
+        try:
+            writes = [(user_id, "progress", "set", key, data[key]) for key in keys if key in data]
+            writes += [(user_id, "progress", "delete", key, None) for key in keys if key not in data]
+            _write(writes)
+        except Exception as e:
+            data.mark_dirty(keys)
+            print(f"Database error in save_progress: {e}")
+            import traceback
+            traceback.print_exc()
+        return
 
-        query = f'INSERT INTO progress (key, completed) VALUES ({placeholder}, {placeholder})'
+    try:
+        with _connection() as (conn, db_type):
+            cursor = conn.cursor()
 
-        for key, completed in data.items():
-            cursor.execute(query, (key, 1 if completed else 0))
+            # Full replace in one transaction, so readers never observe the
+            # map half-written. Dropped keys are deleted one by one so the
+            # change log records each of them.
+            ph = "%s" if db_type == "postgres" else "?"
+            cursor.execute(f'SELECT key FROM progress WHERE user_id = {ph}', (user_id,))
+            removed = [key for (key,) in cursor.fetchall() if key not in data]
 
-        conn.commit()
-        conn.close()
-        print(f"Saved {len(data)} completion records to database (type: {db_type})")
+            _write_rows(cursor, db_type, [
+                (user_id, "progress", "delete", key, None) for key in removed
+            ] + [
+                (user_id, "progress", "set", key, completed) for key, completed in data.items()
+            ])
+
+            conn.commit()
+            print(f"Saved {len(data)} completion records for {user_id} to database (type: {db_type})")
     except Exception as e:
         print(f"Database error in save_progress: {e}")
         import traceback
         traceback.print_exc()
 
-def load_study_time():
+class LRUCache:
+    """Bounded map keeping the `maxsize` most recently used entries.
+
+    get_or_create() builds a missing entry outside the map lock, one build
+    per key at a time, so a slow build (a plan generation, say) neither
+    blocks other keys nor runs twice for the same key. `on_evict(key, value)`
+    is called for each entry pushed out, after the lock is released.
+    """
+
+    def __init__(self, maxsize, on_evict=None):
+        self.maxsize = max(1, maxsize)
+        self._on_evict = on_evict
+        self._data = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """The entry for key, marked recently used — or None."""
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def peek(self, key):
+        """The entry for key or None, without touching recency or counters."""
+        return self._data.get(key)
+
+    def get_or_create(self, key, factory):
+        """The entry for key, built with factory() on a miss."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            value = self.get(key)
+            if value is not None:
+                return value
+            value = factory()
+            evicted = []
+            with self._lock:
+                self.misses += 1
+                self._data[key] = value
+                self._building.pop(key, None)
+                while len(self._data) > self.maxsize:
+                    evicted.append(self._data.popitem(last=False))
+                    self.evictions += 1
+        if self._on_evict is not None:
+            for old_key, old_value in evicted:
+                self._on_evict(old_key, old_value)
+        return value
+
+    def values(self):
+        with self._lock:
+            return list(self._data.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class _TableCache:
+    """Read-through, in-process copy of one user's rows of a key/value table.
+
+    The first load_*() reads the table; after that reads return the cached
+    dict, and the matching set_*() folds each committed write into it. The
+    cached dict is copy-on-write — a write swaps in a new dict — so a caller
+    can serialize the one it got while writes land; treat it as read-only.
+    `version` increases on every change, for cheap change detection (drawn
+    from _VERSION_CLOCK). With a `ttl` (seconds) the
+    copy is re-read once it is that old, which picks up writes made by other
+    processes.
+    """
+
+    def __init__(self, table, reader, user_id, ttl=None):
+        self.table = table
+        self.user_id = user_id
+        self._reader = reader
+        self.ttl = ttl or None
+        self._data = None
+        self._loaded_at = 0.0
+        self.version = next(_VERSION_CLOCK)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        return self._data is not None and (
+            self.ttl is None or time.monotonic() - self._loaded_at < self.ttl
+        )
+
+    # Writers publish the new dict before the new version and readers take
+    # the version before the dict, so a (data, version) pair never carries a
+    # version newer than its data — an ETag built from it can't go stale.
+
+    def peek(self):
+        """(data, version) if the copy is loaded and fresh, else None —
+        never touches the database."""
+        version = self.version
+        if self._fresh():
+            self.hits += 1
+            return self._data, version
+        return None
+
+    def get_versioned(self):
+        """(data, version), reading the table on a miss."""
+        cached = self.peek()
+        if cached is not None:
+            return cached
+        while True:
+            # Every write bumps the version, even while nothing is cached.
+            # Note it before the flush: a write that lands after this point
+            # may be missing from the read, and then the version has moved.
+            seen = self.version
+            if _writer is not None:
+                # Queued writes aren't in the table yet — land them before
+                # the read, or the cache would start out missing them
+                _writer.flush()
+            with self._lock:
+                if self._fresh():
+                    return self._data, self.version
+                self.misses += 1
+                with _connection() as (conn, db_type):
+                    ph = "%s" if db_type == "postgres" else "?"
+                    data = self._reader(conn.cursor(), ph, self.user_id)
+                if self.version != seen:
+                    continue
+                changed = data != self._data
+                self._data = data
+                self._loaded(data)
+                self._loaded_at = time.monotonic()
+                if changed:
+                    self.version = next(_VERSION_CLOCK)
+                return self._data, self.version
+
+    def get(self):
+        return self.get_versioned()[0]
+
+    def apply(self, writes):
+        """Fold committed (mode, key, value) writes into the cached copy."""
+        with self._lock:
+            if self._data is not None:
+                data = dict(self._data)
+                for mode, key, value in writes:
+                    if mode == "delete":
+                        data.pop(key, None)
+                    elif mode == "max" and key in data:
+                        data[key] = max(data[key], value)
+                    else:
+                        data[key] = value
+                self._data = data
+                self._applied(writes)
+            self.version = next(_VERSION_CLOCK)
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+            self.version = next(_VERSION_CLOCK)
+
+    # Hooks for subclasses that keep a secondary index over the cached rows;
+    # both run under the cache lock, after self._data is replaced
+    def _loaded(self, data):
+        pass
+
+    def _applied(self, writes):
+        pass
+
+
+class _ReviewCache(_TableCache):
+    """The reviews cache, plus a due queue: (due, key) for every cached
+    review with a due date, kept sorted as reviews are written, so the
+    reviews due by a date are a bisect and a slice."""
+
+    def __init__(self, table, reader, user_id, ttl=None):
+        super().__init__(table, reader, user_id, ttl)
+        self._due = []      # sorted (due, key)
+        self._due_of = {}   # key -> its entry's due date
+
+    def _loaded(self, data):
+        self._due_of = {}
+        for key, state in data.items():
+            due = _review_columns(state)[0]
+            if due is not None:
+                self._due_of[key] = due
+        self._due = sorted((due, key) for key, due in self._due_of.items())
+
+    def _applied(self, writes):
+        for mode, key, value in writes:
+            old = self._due_of.pop(key, None)
+            if old is not None:
+                del self._due[bisect.bisect_left(self._due, (old, key))]
+            due = _review_columns(value)[0] if mode != "delete" else None
+            if due is not None:
+                self._due_of[key] = due
+                bisect.insort(self._due, (due, key))
+
+    def due(self, on, limit=None):
+        """[(key, state)] due on or before `on`, earliest first (ties by
+        key), or None when the cache isn't loaded and fresh."""
+        with self._lock:
+            if not self._fresh():
+                return None
+            self.hits += 1
+            stop = bisect.bisect_right(self._due, (on, "\uffff"))
+            if limit is not None:
+                stop = min(stop, limit)
+            return [(key, self._data[key]) for _, key in self._due[:stop]]
+
+    def stats(self):
+        return {
+            "loaded": self._data is not None,
+            "rows": len(self._data) if self._data is not None else 0,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+def _read_study_time(cursor, ph, user_id):
+    cursor.execute(f'SELECT key, seconds FROM study_time WHERE user_id = {ph}', (user_id,))
+    return {key: int(seconds) for key, seconds in cursor.fetchall()}
+
+def _read_task_pages(cursor, ph, user_id):
+    cursor.execute(f'SELECT key, page FROM task_pages WHERE user_id = {ph}', (user_id,))
+    return {key: int(page) for key, page in cursor.fetchall()}
+
+def _read_revisions(cursor, ph, user_id):
+    cursor.execute(f'SELECT key, done FROM revisions WHERE user_id = {ph}', (user_id,))
+    return {key: bool(done) for key, done in cursor.fetchall()}
+
+def _read_reviews(cursor, ph, user_id):
+    cursor.execute(f'SELECT key, state FROM reviews WHERE user_id = {ph}', (user_id,))
+    out = {}
+    for key, state in cursor.fetchall():
+        try:
+            out[key] = json.loads(state)
+        except (json.JSONDecodeError, TypeError):
+            continue
+    return out
+
+def _read_preferences(cursor, ph, user_id):
+    cursor.execute(f'SELECT key, value FROM preferences WHERE user_id = {ph}', (user_id,))
+    return {key: value for key, value in cursor.fetchall()}
+
+def _read_confidence(cursor, ph, user_id):
+    cursor.execute(f'SELECT key, level FROM confidence WHERE user_id = {ph}', (user_id,))
+    return {key: level for key, level in cursor.fetchall()}
+
+def _new_user_caches(user_id):
+    return {
+        "study_time": _TableCache("study_time", _read_study_time, user_id),
+        "task_pages": _TableCache("task_pages", _read_task_pages, user_id),
+        "revisions": _TableCache("revisions", _read_revisions, user_id),
+        "reviews": _ReviewCache("reviews", _read_reviews, user_id),
+        "confidence": _TableCache("confidence", _read_confidence, user_id),
+        "preferences": _TableCache("preferences", _read_preferences, user_id, ttl=PREFERENCE_CACHE_TTL),
+    }
+
+# user_id -> {table: _TableCache}, for the USER_CACHE_SIZE most recent users
+_user_caches = LRUCache(USER_CACHE_SIZE)
+
+def _cache(table, user_id):
+    return _user_caches.get_or_create(user_id, lambda: _new_user_caches(user_id))[table]
+
+def _cache_apply(writes):
+    by_cache = {}
+    for user_id, table, mode, key, value in writes:
+        if table == "revisions":
+            value = bool(value)
+        by_cache.setdefault((user_id, table), []).append((mode, key, value))
+    for (user_id, table), rows in by_cache.items():
+        # A user with no cached tables has nothing to keep in step
+        caches = _user_caches.peek(user_id)
+        if caches is not None and table in caches:
+            caches[table].apply(rows)
+
+def _cache_invalidate(writes):
+    for user_id, table in {(user_id, table) for user_id, table, _, _, _ in writes}:
+        caches = _user_caches.peek(user_id)
+        if caches is not None and table in caches:
+            caches[table].invalidate()
+
+def peek_versioned(table, user_id=DEFAULT_USER):
+    """(dict, version) of a user's cached table if it can be served without
+    I/O, else None."""
+    caches = _user_caches.get(user_id)
+    return caches[table].peek() if caches is not None else None
+
+def load_versioned(table, user_id=DEFAULT_USER):
+    """(dict, version) of a user's cached table, reading it on a miss. The
+    version bumps on every change, so it makes a cheap ETag."""
+    return _cache(table, user_id).get_versioned()
+
+def cache_stats():
+    """User-cache counters, plus per-table totals across the cached users."""
+    tables = {}
+    for caches in _user_caches.values():
+        for table, cache in caches.items():
+            total = tables.setdefault(table, {"loaded": 0, "rows": 0, "hits": 0, "misses": 0})
+            stats = cache.stats()
+            total["loaded"] += stats["loaded"]
+            total["rows"] += stats["rows"]
+            total["hits"] += stats["hits"]
+            total["misses"] += stats["misses"]
+    return {"users": _user_caches.stats(), "tables": tables}
+
+_DATE_SLOT_VALUES = {"progress": ("completed", bool), "study_time": ("seconds", int), "task_pages": ("page", int)}
+
+def _load_date_range(table, from_date, to_date, user_id):
+    """A user's rows of a date_slot table whose date falls in [from_date,
+    to_date] (either bound may be None), via the (user_id, date, slot) index."""
+    if _writer is not None:
+        _writer.flush()
+    column, decode = _DATE_SLOT_VALUES[table]
+    with _connection() as (conn, db_type):
+        ph = "%s" if db_type == "postgres" else "?"
+        where = [f"user_id = {ph}", "date IS NOT NULL"]
+        args = [user_id]
+        if from_date:
+            where.append(f"date >= {ph}")
+            args.append(from_date)
+        if to_date:
+            where.append(f"date <= {ph}")
+            args.append(to_date)
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT key, {column} FROM {table} WHERE {" AND ".join(where)}', args)
+        return {key: decode(value) for key, value in cursor.fetchall()}
+
+def load_progress_range(from_date=None, to_date=None, user_id=DEFAULT_USER):
+    """Completion flags for dates in [from_date, to_date] ({"date_slot": bool})"""
+    try:
+        return _load_date_range("progress", from_date, to_date, user_id)
+    except Exception as e:
+        print(f"Database error in load_progress_range: {e}")
+        return {}
+
+def load_study_time_range(from_date=None, to_date=None, user_id=DEFAULT_USER):
+    """Studied seconds for dates in [from_date, to_date] ({"date_slot": seconds})"""
+    try:
+        return _load_date_range("study_time", from_date, to_date, user_id)
+    except Exception as e:
+        print(f"Database error in load_study_time_range: {e}")
+        return {}
+
+def load_task_pages_range(from_date=None, to_date=None, user_id=DEFAULT_USER):
+    """Last pages for dates in [from_date, to_date] ({"date_slot": page})"""
+    try:
+        return _load_date_range("task_pages", from_date, to_date, user_id)
+    except Exception as e:
+        print(f"Database error in load_task_pages_range: {e}")
+        return {}
+
+def load_study_time(user_id=DEFAULT_USER):
     """Load all studied-seconds records ({"date_slot": seconds})"""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT key, seconds FROM study_time')
-        rows = cursor.fetchall()
-        conn.close()
-        return {key: int(seconds) for key, seconds in rows}
+        return _cache("study_time", user_id).get()
     except Exception as e:
         print(f"Database error in load_study_time: {e}")
         return {}
 
-def set_study_time(key, seconds):
+def set_study_time(key, seconds, user_id=DEFAULT_USER):
     """Upsert studied seconds for a task — monotonic (never decreases), so a
     stale device syncing late can't erase time recorded elsewhere."""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-
-        if db_type == "postgres":
-            cursor.execute('''
-                INSERT INTO study_time (key, seconds) VALUES (%s, %s)
-                ON CONFLICT (key) DO UPDATE
-                SET seconds = GREATEST(study_time.seconds, EXCLUDED.seconds)
-            ''', (key, seconds))
-        else:
-            cursor.execute('''
-                INSERT INTO study_time (key, seconds) VALUES (?, ?)
-                ON CONFLICT(key) DO UPDATE
-                SET seconds = MAX(seconds, excluded.seconds)
-            ''', (key, seconds))
-
-        conn.commit()
-        conn.close()
+        _write([(user_id, "study_time", "max", key, seconds)])
     except Exception as e:
         print(f"Database error in set_study_time: {e}")
 
-def load_task_pages():
+def load_task_pages(user_id=DEFAULT_USER):
     """Load all last-page records ({"date_slot": page})"""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT key, page FROM task_pages')
-        rows = cursor.fetchall()
-        conn.close()
-        return {key: int(page) for key, page in rows}
+        return _cache("task_pages", user_id).get()
     except Exception as e:
         print(f"Database error in load_task_pages: {e}")
         return {}
 
-def set_task_page(key, page, exact=False):
+def set_task_page(key, page, exact=False, user_id=DEFAULT_USER):
     """Upsert the last page reached for a task.
 
     Default is monotonic (never decreases) so a stale device syncing late can't
     rewind a page recorded elsewhere. `exact=True` overwrites — used when the
     user deliberately sets the page, including correcting it downwards."""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-
-        if db_type == "postgres":
-            if exact:
-                cursor.execute('''
-                    INSERT INTO task_pages (key, page) VALUES (%s, %s)
-                    ON CONFLICT (key) DO UPDATE SET page = EXCLUDED.page
-                ''', (key, page))
-            else:
-                cursor.execute('''
-                    INSERT INTO task_pages (key, page) VALUES (%s, %s)
-                    ON CONFLICT (key) DO UPDATE
-                    SET page = GREATEST(task_pages.page, EXCLUDED.page)
-                ''', (key, page))
-        else:
-            if exact:
-                cursor.execute('INSERT OR REPLACE INTO task_pages (key, page) VALUES (?, ?)', (key, page))
-            else:
-                cursor.execute('''
-                    INSERT INTO task_pages (key, page) VALUES (?, ?)
-                    ON CONFLICT(key) DO UPDATE
-                    SET page = MAX(page, excluded.page)
-                ''', (key, page))
-
-        conn.commit()
-        conn.close()
+        _write([(user_id, "task_pages", "set" if exact else "max", key, page)])
     except Exception as e:
         print(f"Database error in set_task_page: {e}")
 
-def load_revisions():
+def load_revisions(user_id=DEFAULT_USER):
     """Load all revision done-flags ({"key": bool})"""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT key, done FROM revisions')
-        rows = cursor.fetchall()
-        conn.close()
-        return {key: bool(done) for key, done in rows}
+        return _cache("revisions", user_id).get()
     except Exception as e:
         print(f"Database error in load_revisions: {e}")
         return {}
 
-def set_revision(key, done):
+def set_revision(key, done, user_id=DEFAULT_USER):
     """Upsert a revision done-flag — a plain overwrite (boolean, not monotonic)."""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-
-        if db_type == "postgres":
-            cursor.execute('''
-                INSERT INTO revisions (key, done) VALUES (%s, %s)
-                ON CONFLICT (key) DO UPDATE SET done = EXCLUDED.done
-            ''', (key, 1 if done else 0))
-        else:
-            cursor.execute(
-                'INSERT OR REPLACE INTO revisions (key, done) VALUES (?, ?)',
-                (key, 1 if done else 0),
-            )
-
-        conn.commit()
-        conn.close()
+        _write([(user_id, "revisions", "set", key, done)])
     except Exception as e:
         print(f"Database error in set_revision: {e}")
 
-def load_reviews():
+def load_reviews(user_id=DEFAULT_USER):
     """Load all SM-2 review states ({"slug": {due, interval, ease, reps, ...}}).
-    State is stored as a JSON blob per chapter slug; a corrupt row is skipped."""
+    State is stored as a JSON blob per chapter slug and decoded once, when the
+    cache first loads; a corrupt row is skipped."""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT key, state FROM reviews')
-        rows = cursor.fetchall()
-        conn.close()
-        out = {}
-        for key, state in rows:
-            try:
-                out[key] = json.loads(state)
-            except (json.JSONDecodeError, TypeError):
-                continue
-        return out
+        return _cache("reviews", user_id).get()
     except Exception as e:
         print(f"Database error in load_reviews: {e}")
         return {}
 
-def set_review(key, state):
+def _due_entry(key, due, interval, ease, reps):
+    return {"key": key, "due": due, "interval": interval, "ease": ease, "reps": reps}
+
+def load_reviews_due(on, limit=None, user_id=DEFAULT_USER):
+    """Reviews due on or before `on`, earliest first (ties by key), as
+    [{key, due, interval, ease, reps}], at most `limit` of them.
+
+    With the reviews cache loaded this is a slice of its sorted due queue;
+    otherwise an index range scan on (user_id, due) over the typed columns.
+    Either way only the returned reviews are looked at."""
+    try:
+        due = _cache("reviews", user_id).due(on, limit)
+        if due is not None:
+            return [_due_entry(key, *_review_columns(state)) for key, state in due]
+        if _writer is not None:
+            _writer.flush()
+        with _connection() as (conn, db_type):
+            ph = "%s" if db_type == "postgres" else "?"
+            sql = (
+                f'SELECT key, due, interval_days, ease, reps FROM reviews '
+                f'WHERE user_id = {ph} AND due IS NOT NULL AND due <= {ph} ORDER BY due, key'
+            )
+            args = [user_id, on]
+            if limit is not None:
+                sql += f' LIMIT {ph}'
+                args.append(limit)
+            cursor = conn.cursor()
+            cursor.execute(sql, args)
+            return [_due_entry(*row) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Database error in load_reviews_due: {e}")
+        return []
+
+def set_review(key, state, user_id=DEFAULT_USER):
     """Upsert a chapter's review state — a plain overwrite (the client owns the
     SM-2 progression and always posts the full, current state)."""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-        blob = json.dumps(state)
-
-        if db_type == "postgres":
-            cursor.execute('''
-                INSERT INTO reviews (key, state) VALUES (%s, %s)
-                ON CONFLICT (key) DO UPDATE SET state = EXCLUDED.state
-            ''', (key, blob))
-        else:
-            cursor.execute('INSERT OR REPLACE INTO reviews (key, state) VALUES (?, ?)', (key, blob))
-
-        conn.commit()
-        conn.close()
+        _write([(user_id, "reviews", "set", key, state)])
     except Exception as e:
         print(f"Database error in set_review: {e}")
 
-def load_confidence():
+def load_confidence(user_id=DEFAULT_USER):
     """Load all confidence levels ({"slug": "weak"|"medium"|"strong"})"""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT key, level FROM confidence')
-        rows = cursor.fetchall()
-        conn.close()
-        return {key: level for key, level in rows}
+        return _cache("confidence", user_id).get()
     except Exception as e:
         print(f"Database error in load_confidence: {e}")
         return {}
 
-def set_confidence(key, level):
+def set_confidence(key, level, user_id=DEFAULT_USER):
     """Upsert a chapter's confidence level — a plain overwrite."""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-
-        if db_type == "postgres":
-            cursor.execute('''
-                INSERT INTO confidence (key, level) VALUES (%s, %s)
-                ON CONFLICT (key) DO UPDATE SET level = EXCLUDED.level
-            ''', (key, level))
-        else:
-            cursor.execute('INSERT OR REPLACE INTO confidence (key, level) VALUES (?, ?)', (key, level))
-
-        conn.commit()
-        conn.close()
+        _write([(user_id, "confidence", "set", key, level)])
     except Exception as e:
         print(f"Database error in set_confidence: {e}")
 
-def get_preference(key, default=None):
-    """Get a preference value by key"""
+def get_preference(key, default=None, user_id=DEFAULT_USER):
+    """Get a preference value by key (served from the preference cache)"""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-        
-        if db_type == "postgres":
-             cursor.execute('SELECT value FROM preferences WHERE key = %s', (key,))
-        else:
-             cursor.execute('SELECT value FROM preferences WHERE key = ?', (key,))
-             
-        row = cursor.fetchone()
-        conn.close()
-        
-        return row[0] if row else default
+        return _cache("preferences", user_id).get().get(key, default)
     except Exception as e:
         print(f"Database error in get_preference: {e}")
         return default
 
-def set_preference(key, value):
-    """Set a preference value"""
+def set_preference(key, value, user_id=DEFAULT_USER):
+    """Set a preference value (write-through to the preference cache)"""
     try:
-        conn, db_type = get_db_connection()
-        cursor = conn.cursor()
-        
-        if db_type == "postgres":
-            # UPSERT syntax for Postgres
-            cursor.execute('''
-                INSERT INTO preferences (key, value) VALUES (%s, %s)
-                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
-            ''', (key, value))
-        else:
-            # UPSERT syntax for SQLite
-            cursor.execute('INSERT OR REPLACE INTO preferences (key, value) VALUES (?, ?)', (key, value))
-            
-        conn.commit()
-        conn.close()
+        _write([(user_id, "preferences", "set", key, value)])
     except Exception as e:
         print(f"Database error in set_preference: {e}")
+
+def load_schedule_snapshot(fingerprint, user_id=DEFAULT_USER):
+    """A user's persisted plan, if it was generated from this fingerprint"""
+    try:
+        with _connection() as (conn, db_type):
+            cursor = conn.cursor()
+            if db_type == "postgres":
+                cursor.execute(
+                    'SELECT plan FROM schedule_snapshot WHERE user_id = %s AND fingerprint = %s',
+                    (user_id, fingerprint),
+                )
+            else:
+                cursor.execute(
+                    'SELECT plan FROM schedule_snapshot WHERE user_id = ? AND fingerprint = ?',
+                    (user_id, fingerprint),
+                )
+            row = cursor.fetchone()
+        return json.loads(row[0]) if row else None
+    except Exception as e:
+        print(f"Database error in load_schedule_snapshot: {e}")
+        return None
+
+def save_schedule_snapshot(fingerprint, plan, user_id=DEFAULT_USER):
+    """Persist a user's generated plan, replacing their snapshot of an older config"""
+    try:
+        blob = json.dumps(plan, separators=(",", ":"))
+        with _connection() as (conn, db_type):
+            cursor = conn.cursor()
+            if db_type == "postgres":
+                cursor.execute('''
+                    INSERT INTO schedule_snapshot (user_id, fingerprint, plan) VALUES (%s, %s, %s)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET fingerprint = EXCLUDED.fingerprint, plan = EXCLUDED.plan
+                ''', (user_id, fingerprint, blob))
+            else:
+                cursor.execute(
+                    'INSERT OR REPLACE INTO schedule_snapshot (user_id, fingerprint, plan) VALUES (?, ?, ?)',
+                    (user_id, fingerprint, blob),
+                )
+            conn.commit()
+    except Exception as e:
+        print(f"Database error in save_schedule_snapshot: {e}")
+
+def load_changes(since, user_id=DEFAULT_USER):
+    """A user's synced rows changed after version `since`.
+
+    Returns {"version", "reset", "changes": {table: {key: value}},
+    "deleted": {table: [key]}}; the client passes "version" back as its next
+    `since`. "reset" means `since` is older than the compacted log (or from
+    another database) — the response then holds every row, and the client
+    should replace its copy rather than merge. None on a database error."""
+    try:
+        if _writer is not None:
+            _writer.flush()
+        with _connection() as (conn, db_type):
+            ph = "%s" if db_type == "postgres" else "?"
+            cursor = conn.cursor()
+            # Read the clock first: rows committed after it are returned too,
+            # and returned again next time, which is harmless
+            cursor.execute('SELECT version, horizon FROM change_clock')
+            version, horizon = cursor.fetchone()
+            reset = since < horizon or since > version
+            if reset:
+                since = 0
+            changes = {}
+            deleted = {}
+            for table, (column, decode) in _SYNC_TABLES.items():
+                cursor.execute(f'''
+                    SELECT c.key, c.deleted, t.{column} FROM change_log c
+                    LEFT JOIN {table} t ON t.user_id = c.user_id AND t.key = c.key
+                    WHERE c.user_id = {ph} AND c.tbl = {ph} AND c.version > {ph}
+                ''', (user_id, table, since))
+                for key, is_deleted, value in cursor.fetchall():
+                    if is_deleted or value is None:
+                        if since:
+                            deleted.setdefault(table, []).append(key)
+                        continue
+                    try:
+                        changes.setdefault(table, {})[key] = decode(value)
+                    except (ValueError, TypeError):
+                        continue
+        return {"version": version, "reset": reset, "changes": changes, "deleted": deleted}
+    except Exception as e:
+        print(f"Database error in load_changes: {e}")
+        return None
+
+def load_preference_users(key):
+    """{user_id: value} for every user that has preference `key` set"""
+    try:
+        flush_writes()
+        with _connection() as (conn, db_type):
+            ph = "%s" if db_type == "postgres" else "?"
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT user_id, value FROM preferences WHERE key = {ph}', (key,))
+            return {user_id: value for user_id, value in cursor.fetchall() if value}
+    except Exception as e:
+        print(f"Database error in load_preference_users: {e}")
+        return {}
@@ -0,0 +1,94 @@
+import datetime
+
+from plan_view import PlanAnalytics, SerializedPlan
+
+
+class _Progress:
+    """The one ProgressMap method PlanAnalytics reads."""
+
+    def __init__(self, done=()):
+        self._done = set(done)
+
+    def day(self, date):
+        return {slot: True for d, slot in self._done if d == date}
+
+
+def _client_pages_read(stored, min_start, max_end):
+    """TodayView's count of pages read in an open block: the stored page is
+    the last page read, inclusive."""
+    total = max_end - min_start + 1 if max_end > 0 else 0
+    return min(total, max(0, stored - min_start + 1)) if stored else 0
+
+
+SCHEDULE = [{
+    "date": "2026-07-20",
+    "day": "Monday",
+    "slots": [{
+        "name": "Morning",
+        "subject": "Polity",
+        "task": "3. Courts (pp.20-29)",
+        "minutes": 40,
+        "segments": [{"chapter": "3. Courts", "start": 20, "end": 29, "minutes": 40}],
+    }],
+}]
+
+
+def _pages_read(task_pages, done=()):
+    analytics = PlanAnalytics(SCHEDULE, _Progress(done), {}, task_pages)
+    return analytics.query()["totals"]["Polity"]["pages_read"]
+
+
+def test_open_block_pages_read_matches_client():
+    for stored in (None, 5, 19, 20, 21, 25, 28, 29, 40):
+        task_pages = {"2026-07-20_Morning": stored} if stored else {}
+        assert _pages_read(task_pages) == _client_pages_read(stored, 20, 29), stored
+
+
+def test_last_page_read_counts_whole_block():
+    assert _pages_read({"2026-07-20_Morning": 29}) == 10
+
+
+def test_task_page_update_matches_client():
+    analytics = PlanAnalytics(SCHEDULE, _Progress(), {}, {})
+    analytics.task_page_changed("2026-07-20_Morning", 24, exact=True)
+    assert analytics.query()["totals"]["Polity"]["pages_read"] == _client_pages_read(24, 20, 29)
+
+
+def test_completed_block_counts_every_page():
+    assert _pages_read({"2026-07-20_Morning": 22}, done=[("2026-07-20", "Morning")]) == 10
+
+
+def _ten_day_plan():
+    start = datetime.date(2026, 7, 20)
+    return SerializedPlan([
+        {"date": (start + datetime.timedelta(days=i)).isoformat(), "day": "", "slots": []}
+        for i in range(10)
+    ])
+
+
+def test_page_stops_at_to_without_cursor():
+    plan = _ten_day_plan()
+    # days doesn't bind: the window ends at `to`, so there is no next page
+    assert plan.page("2026-07-20", "2026-07-22", days=5) == (0, 3, None)
+    # days binds exactly at `to`
+    assert plan.page("2026-07-20", "2026-07-22", days=3) == (0, 3, None)
+
+
+def test_page_cursor_stays_within_to():
+    plan = _ten_day_plan()
+    start, stop, cursor = plan.page("2026-07-20", "2026-07-24", days=2)
+    assert (start, stop, cursor) == (0, 2, "2026-07-22")
+    # Following the cursors with the same `to` walks the range and ends
+    seen = list(plan.dates[start:stop])
+    while cursor is not None:
+        start, stop, cursor = plan.page(cursor, "2026-07-24", days=2)
+        assert cursor is None or cursor <= "2026-07-24"
+        seen.extend(plan.dates[start:stop])
+    assert seen == plan.dates[:5]
+
+
+def test_page_without_to_pages_to_plan_end():
+    plan = _ten_day_plan()
+    assert plan.page(None, None, days=4)[2] == "2026-07-24"
+    assert plan.page("2026-07-28", None, days=4) == (8, 10, None)
+    assert plan.page() == (0, 10, None)
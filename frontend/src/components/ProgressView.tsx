@@ -3,7 +3,7 @@ import { motion } from 'framer-motion';
 import { DayPlan, Slot } from '../interfaces';
 import { summarizeTask } from './TaskContent';
 import { subjectColor } from '../subjectColors';
-import { pagesInTask, fmtMinutes } from '../insights';
+import { pagesInSlot, fmtMinutes } from '../insights';
 import { overrunInsight, loadStudyTime } from '../insights';
 
 export interface DayStat {
@@ -248,7 +248,7 @@ export function ProgressView({
     let weekBlocks = 0, weekPages = 0, weekFull = 0;
     last7.forEach(d => {
         const done = d.slots.filter(s => s.completed).length;
-        d.slots.forEach(s => { if (s.completed) { weekBlocks++; weekPages += pagesInTask(s.task); } });
+        d.slots.forEach(s => { if (s.completed) { weekBlocks++; weekPages += pagesInSlot(s); } });
         if (d.slots.length > 0 && done === d.slots.length) weekFull++;
     });
     let weekSecs = 0;
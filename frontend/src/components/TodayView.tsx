@@ -6,7 +6,7 @@ import { DayPlan, Slot } from '../interfaces';
 import { parseItems, summarizeTask } from './TaskContent';
 import { subjectColor } from '../subjectColors';
 import { useSettings } from '../settings';
-import { calibratedMinutes, pagesInTask, fmtMinutes } from '../insights';
+import { calibratedMinutes, pagesInSlot, fmtMinutes } from '../insights';
 import {
     dueReviews, applyRating, previewInterval,
     Rating, Confidence, ReviewState, DueReview,
@@ -18,15 +18,20 @@ import {
 } from '../liveActivity';
 
 
-/** Task's page span: min start, max end, and pages treated as one continuous range */
-function pageRangeOf(task: string) {
+/** Slot's page span: min start, max end, and pages treated as one continuous range.
+    Uses the scheduler's segments; older plans fall back to the task's "pp.a-b" text. */
+function pageRangeOf(slot: Pick<Slot, 'task' | 'segments'>) {
     let minStart = Infinity, maxEnd = 0;
-    const re = /pp\.(\d+)\s*-\s*(\d+)/g;
-    let m: RegExpExecArray | null;
-    while ((m = re.exec(task)) !== null) {
-        const a = Number(m[1]), b = Number(m[2]);
+    const span = (a: number, b: number) => {
         if (a < minStart) minStart = a;
         if (b > maxEnd) maxEnd = b;
+    };
+    if (slot.segments) {
+        for (const seg of slot.segments) span(seg.start, seg.end);
+    } else {
+        const re = /pp\.(\d+)\s*-\s*(\d+)/g;
+        let m: RegExpExecArray | null;
+        while ((m = re.exec(slot.task)) !== null) span(Number(m[1]), Number(m[2]));
     }
     if (!isFinite(minStart)) minStart = 0;
     const total = maxEnd > 0 ? maxEnd - minStart + 1 : 0;
@@ -531,7 +536,7 @@ function FocusSheet({
     // Focus seconds accumulated this session — gates the "where did you stop?" step
     const [sessionSecs, setSessionSecs] = useState(0);
     // "Where did you stop?" interstitial + the page being picked
-    const pageRange = pageRangeOf(slot.task);
+    const pageRange = pageRangeOf(slot);
     const hasPages = pageRange.total > 0;
     const [ending, setEnding] = useState(false);
     const [page, setPage] = useState(pageRange.maxEnd);
@@ -1125,7 +1130,7 @@ function PagePicker({
     slot: Slot; initialPage: number;
     onSave: (page: number) => void; onClose: () => void;
 }) {
-    const range = pageRangeOf(slot.task);
+    const range = pageRangeOf(slot);
     const [page, setPage] = useState(Math.min(range.maxEnd, Math.max(range.minStart, initialPage)));
     const c = subjectColor(slot.subject);
 
@@ -1519,7 +1524,7 @@ export function TodayView({
         if (slot.completed) return 0;
         const key = studyKeyOf(date, slot.name);
         const timeShare = slot.minutes ? Math.min(1, (studyTime[key] || 0) / (slot.minutes * 60)) : 0;
-        const { minStart, total } = pageRangeOf(slot.task);
+        const { minStart, total } = pageRangeOf(slot);
         const stored = taskPages[key];
         const pagesShare = stored && total > 0
             ? Math.min(1, Math.max(0, stored - minStart + 1) / total)
@@ -1570,8 +1575,8 @@ export function TodayView({
     const filteredBacklog = activeFilter ? backlog.filter(b => b.slot.subject === activeFilter) : backlog;
     const visibleBacklog = filteredBacklog.slice(0, backlogVisible);
 
-    // Pages remaining today, from the "pp.a-b" ranges of incomplete blocks
-    const pagesLeft = slots.filter(s => !s.completed).reduce((a, s) => a + pagesInTask(s.task), 0);
+    // Pages remaining today, from the page ranges of incomplete blocks
+    const pagesLeft = slots.filter(s => !s.completed).reduce((a, s) => a + pagesInSlot(s), 0);
 
     // All scheduled blocks ahead — for working ahead when there's spare time
     const upcomingRows: { slot: Slot; date: string }[] = [];
@@ -1615,7 +1620,7 @@ export function TodayView({
 
     const heroColor = hero ? subjectColor(hero.subject) : null;
     const heroItems = hero ? parseItems(hero.task) : [];
-    const heroPages = hero ? pagesInTask(hero.task) : 0;
+    const heroPages = hero ? pagesInSlot(hero) : 0;
     const heroEst = hero ? (calibratedMinutes(hero, pace) ?? (typeof hero.minutes === 'number' && hero.minutes > 0 ? hero.minutes : null)) : null;
     const heroLoading = hero ? busy === `${dateStr}-${hero.name}` : false;
 
@@ -2221,7 +2226,7 @@ export function TodayView({
                     <PagePicker
                         slot={pageEditTarget.slot}
                         initialPage={taskPages[studyKeyOf(pageEditTarget.date, pageEditTarget.slot.name)]
-                            ?? pageRangeOf(pageEditTarget.slot.task).minStart}
+                            ?? pageRangeOf(pageEditTarget.slot).minStart}
                         onSave={page => {
                             // Deliberate edit — authoritative, so it can lower the page too
                             setTaskPage(studyKeyOf(pageEditTarget.date, pageEditTarget.slot.name), page, true);
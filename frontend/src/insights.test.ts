@@ -0,0 +1,28 @@
+import { describe, expect, it } from 'vitest';
+import { pagesInSlot, pagesInTask } from './insights';
+
+describe('pagesInSlot', () => {
+    it('sums the segments when the slot has them', () => {
+        const slot = {
+            task: '1. Intro (pp.1-10), 2. Basics (pp.11-12)',
+            segments: [
+                { chapter: '1. Intro', start: 1, end: 10, minutes: 30 },
+                { chapter: '2. Basics', start: 11, end: 12, minutes: 6 },
+            ],
+        };
+        expect(pagesInSlot(slot)).toBe(12);
+    });
+
+    it('falls back to the task text for slots without segments', () => {
+        // Revision/Buffer slots and plans cached before segments existed
+        expect(pagesInSlot({ task: '3. Courts (pp.20-28), 4. Tribunals (pp.29-30)' })).toBe(11);
+        expect(pagesInSlot({ task: 'Subject Revision' })).toBe(0);
+    });
+
+    it('agrees with pagesInTask on the same reading', () => {
+        const task = '5. Budget (pp.40-52)';
+        expect(pagesInSlot({ task })).toBe(pagesInTask(task));
+        expect(pagesInSlot({ task, segments: [{ chapter: '5. Budget', start: 40, end: 52, minutes: 39 }] }))
+            .toBe(pagesInTask(task));
+    });
+});
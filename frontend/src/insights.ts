@@ -9,6 +9,14 @@ export function pagesInTask(task: string) {
     return total;
 }
 
+/** Total pages a slot reads — from its segments, or its task text for older plans */
+export function pagesInSlot(slot: Pick<Slot, 'task' | 'segments'>) {
+    if (!slot.segments) return pagesInTask(slot.task);
+    let total = 0;
+    for (const seg of slot.segments) total += Math.max(0, seg.end - seg.start + 1);
+    return total;
+}
+
 /** "45 min" / "1h 20m" */
 export function fmtMinutes(min: number) {
     if (min < 60) return `${min} min`;
@@ -38,7 +46,7 @@ export function personalPace(plan: DayPlan[], studyTime: Record<string, number>)
             if (!slot.completed) continue;
             const sec = studyTime[`${day.date}_${slot.name}`] || 0;
             if (sec < MIN_STUDIED_SEC) continue;
-            const pages = pagesInTask(slot.task);
+            const pages = pagesInSlot(slot);
             if (pages <= 0) continue;
             const a = acc[slot.subject] || (acc[slot.subject] = { sum: 0, n: 0 });
             a.sum += (sec / 60) / pages;
@@ -61,7 +69,7 @@ export function overrunInsight(plan: DayPlan[], studyTime: Record<string, number
             if (!slot.completed) continue;
             const sec = studyTime[`${day.date}_${slot.name}`] || 0;
             if (sec < MIN_STUDIED_SEC) continue;
-            const pages = pagesInTask(slot.task);
+            const pages = pagesInSlot(slot);
             if (pages <= 0) continue;
             if (typeof slot.minutes !== 'number' || slot.minutes <= 0) continue;
             const a = acc[slot.subject] || (acc[slot.subject] = { actual: 0, planned: 0, n: 0, evening: 0 });
@@ -91,7 +99,7 @@ export function overrunInsight(plan: DayPlan[], studyTime: Record<string, number
 export function calibratedMinutes(slot: Slot, pace: Record<string, number>): number | null {
     const p = pace[slot.subject];
     if (typeof p !== 'number') return null;
-    const pages = pagesInTask(slot.task);
+    const pages = pagesInSlot(slot);
     if (pages <= 0) return null;
     return Math.round((pages * p) / 5) * 5;
 }
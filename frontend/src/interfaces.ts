@@ -1,3 +1,11 @@
+/** One chapter's page range within a slot, as the scheduler planned it */
+export interface Segment {
+    chapter: string;
+    start: number;
+    end: number;
+    minutes: number;
+}
+
 export interface Slot {
     name: string;
     subject: string;
@@ -5,6 +13,8 @@ export interface Slot {
     completed: boolean;
     /** Estimated reading time from the scheduler (hardness-weighted) */
     minutes?: number;
+    /** Structured form of `task`; absent on Revision/Buffer slots and older plans */
+    segments?: Segment[];
 }
 
 export interface DayPlan {
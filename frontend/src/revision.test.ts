@@ -0,0 +1,34 @@
+import { describe, expect, it } from 'vitest';
+import { DayPlan } from './interfaces';
+import { dueReviews, ReviewState } from './revision';
+
+const TITLE = 'Greek System (Sophists, Socrates, Plato, Aristotle)';
+
+const plan: DayPlan[] = [{
+    date: '2026-07-20',
+    day: 'Monday',
+    slots: [{
+        name: 'Morning',
+        subject: 'Western Philosophy',
+        task: `2. ${TITLE} (pp.87-104)`,
+        completed: true,
+        segments: [{ chapter: `2. ${TITLE}`, start: 87, end: 104, minutes: 54 }],
+    }],
+}];
+
+const saved: ReviewState = { due: '2026-07-25', interval: 5, ease: 2.45, reps: 1, last: '2026-07-20', lastRating: 'easy' };
+
+describe('dueReviews', () => {
+    it('finds state saved under the legacy comma-cut key', () => {
+        const [rev] = dueReviews(plan, { aristotle: saved }, { aristotle: 'weak' }, '2026-07-30');
+        expect(rev.slug).toBe('greek-system-sophists-socrates-plato-aristotle');
+        expect(rev.state).toEqual(saved);
+        expect(rev.confidence).toBe('weak');
+    });
+
+    it('prefers state under the current key once one is written', () => {
+        const next: ReviewState = { ...saved, due: '2026-08-10', reps: 2 };
+        const reviews = { aristotle: saved, 'greek-system-sophists-socrates-plato-aristotle': next };
+        expect(dueReviews(plan, reviews, {}, '2026-07-30')).toEqual([]);
+    });
+});
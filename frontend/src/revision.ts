@@ -1,4 +1,4 @@
-import { DayPlan } from './interfaces';
+import { DayPlan, Slot } from './interfaces';
 
 /** One "title (pp.a-b)" reading segment inside a task string.
     Non-greedy title so an inner "(...)" in the title is kept but the trailing
@@ -10,11 +10,45 @@ function cleanTitle(raw: string): string {
     return raw.trim().replace(/^\s*\d+\s*[.:]\s*/, '').trim();
 }
 
+/** A slot's reading segments as (title, first page, last page). Taken from the
+    scheduler's segments; older plans without them fall back to SEG_RE on the task. */
+function readingSegments(slot: Slot): { title: string; start: number; end: number }[] {
+    if (slot.segments) {
+        return slot.segments.map(seg => ({ title: cleanTitle(seg.chapter), start: seg.start, end: seg.end }));
+    }
+    const out: { title: string; start: number; end: number }[] = [];
+    SEG_RE.lastIndex = 0;
+    let m: RegExpExecArray | null;
+    while ((m = SEG_RE.exec(slot.task)) !== null) {
+        out.push({ title: cleanTitle(m[1]), start: Number(m[2]), end: Number(m[3]) });
+    }
+    return out;
+}
+
 /** URL/key-safe slug of a chapter title */
 function slugify(s: string): string {
     return s.toLowerCase().replace(/[^a-z0-9]+/g, '-').replace(/^-+|-+$/g, '');
 }
 
+/** Key the task-text parser gave a chapter before plans carried segments: SEG_RE
+    can't span a comma, so a title like "Greek System (Sophists, ..., Aristotle)"
+    was cut at its last comma and stored as "aristotle". Null when the title has
+    no comma (its key never changed). */
+function legacySlug(title: string): string | null {
+    const i = title.lastIndexOf(',');
+    return i < 0 ? null : slugify(cleanTitle(title.slice(i + 1)));
+}
+
+/** A chapter's entry in a slug-keyed record, falling back to its legacy key so
+    state saved before the key change isn't orphaned. The next write goes to
+    the current slug, which then takes precedence. */
+function lookupChapter<T>(record: Record<string, T>, title: string): T | undefined {
+    const current = record[slugify(title)];
+    if (current !== undefined) return current;
+    const legacy = legacySlug(title);
+    return legacy ? record[legacy] : undefined;
+}
+
 /** Whole-day difference toISO − fromISO, both "YYYY-MM-DD" (local-calendar safe) */
 function daysBetween(fromISO: string, toISO: string): number {
     const [fy, fm, fd] = fromISO.split('-').map(Number);
@@ -49,13 +83,8 @@ export function chapterCompletions(plan: DayPlan[]): ChapterCompletion[] {
     for (const day of plan) {
         for (const slot of day.slots) {
             if (slot.subject === 'Revision' || slot.subject === 'Buffer') continue;
-            SEG_RE.lastIndex = 0;
-            let m: RegExpExecArray | null;
-            while ((m = SEG_RE.exec(slot.task)) !== null) {
-                const title = cleanTitle(m[1]);
+            for (const { title, start, end } of readingSegments(slot)) {
                 if (!title) continue;
-                const start = Number(m[2]);
-                const end = Number(m[3]);
                 let agg = map.get(title);
                 if (!agg) {
                     agg = { subject: slot.subject, minStart: start, maxEnd: end, allCompleted: true, lastCompletedOn: null };
@@ -151,11 +180,11 @@ export function derivedConfidence(state?: ReviewState): Confidence {
 
 /** Manual override wins; otherwise fall back to the derived level. */
 export function effectiveConfidence(
-    slug: string,
+    chapter: string,
     reviews: Record<string, ReviewState>,
     confidence: Record<string, Confidence>,
 ): Confidence {
-    return confidence[slug] ?? derivedConfidence(reviews[slug]);
+    return lookupChapter(confidence, chapter) ?? derivedConfidence(lookupChapter(reviews, chapter));
 }
 
 export interface DueReview {
@@ -186,12 +215,12 @@ export function dueReviews(
     const due: DueReview[] = [];
     for (const c of completions) {
         const slug = slugify(c.chapter);
-        const state = reviews[slug] ?? seedState(c.completedOn);
+        const state = lookupChapter(reviews, c.chapter) ?? seedState(c.completedOn);
         if (state.due > todayStr) continue;
         due.push({
             slug, chapter: c.chapter, subject: c.subject, pages: c.pages,
             completedOn: c.completedOn, state,
-            confidence: effectiveConfidence(slug, reviews, confidence),
+            confidence: effectiveConfidence(c.chapter, reviews, confidence),
             overdueDays: daysBetween(state.due, todayStr),
         });
     }